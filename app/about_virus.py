@@ -514,9 +514,9 @@ def dataset_from_df(virus, df: pd.DataFrame, config):
     # collection date range
     collection_date_col = "collection_date"
     if collection_date_col in df.columns:
-        df[collection_date_col] = pd.to_datetime(df[collection_date_col], errors="coerce")
-        min_date = df[collection_date_col].min()
-        max_date = df[collection_date_col].max()
+        collection_dates = pd.to_datetime(df[collection_date_col], errors="coerce")
+        min_date = collection_dates.min()
+        max_date = collection_dates.max()
         st.markdown(f"- **Collection Date Range:** {min_date.date()} to {max_date.date()}")
 
     # number of unique countries in the dataset
@@ -540,7 +540,7 @@ def dataset_from_df(virus, df: pd.DataFrame, config):
         with st.expander("Lineage Distribution", expanded=False):
             # display it as a table, not a bar plot
             lineage_counts = df[lineage_col].value_counts().reset_index()
-            lineage_counts.columns = ["Lineage", "Count"]
+            lineage_counts = lineage_counts.set_axis(["Lineage", "Count"], axis=1)
             st.dataframe(lineage_counts, hide_index=True, use_container_width=False)
 
     if virus not in ["sars-cov-2"]:
@@ -580,7 +580,7 @@ def dataset_from_df(virus, df: pd.DataFrame, config):
             else:
                 st.markdown(f"- **Lineages before HaploCoV:** {existing_lineages_count}")
                 with st.expander("Existing nomenclature:", expanded=False):
-                    existing_lineages_df = existing_lineages.value_counts().reset_index()
+                    existing_lineages_df = existing_lineages.value_counts().loc[lambda counts: counts > 0].reset_index()
                     existing_lineages_df.columns = ["Lineage", "Count"]
                     st.dataframe(existing_lineages_df, hide_index=True, use_container_width=False)
 
@@ -591,7 +591,7 @@ def dataset_from_df(virus, df: pd.DataFrame, config):
 
                 st.markdown(markdown_text)
                 with st.expander("HaploCoV-assigned lineages:", expanded=False):
-                    haplocov_lineages_df = haplocov_lineages.value_counts().reset_index()
+                    haplocov_lineages_df = haplocov_lineages.value_counts().loc[lambda counts: counts > 0].reset_index()
                     haplocov_lineages_df.columns = ["Lineage", "Count"]
                     st.dataframe(haplocov_lineages_df, hide_index=True, use_container_width=False)
 
@@ -613,7 +613,7 @@ def dataset_from_stats(virus, stats: dict):
     with st.expander("Country Distribution", expanded=False):
         country_counts = stats.get("country_distribution", {})
         if country_counts is not None and not country_counts.empty:
-            country_counts.columns = ["Country", "Count"]
+            country_counts = country_counts.set_axis(["Country", "Count"], axis=1)
             fig = px.bar(country_counts, x="Country", y="Count", title="Number of Sequences per Country (Log Scale)", log_y=True)
             st.plotly_chart(fig, use_container_width=True)
         else:
@@ -626,7 +626,7 @@ def dataset_from_stats(virus, stats: dict):
     with st.expander("Lineage Distribution", expanded=False):
         lineage_counts = stats.get("lineage_distribution", {})
         if lineage_counts is not None and not lineage_counts.empty:
-            lineage_counts.columns = ["Lineage", "Count"]
+            lineage_counts = lineage_counts.set_axis(["Lineage", "Count"], axis=1)
             st.dataframe(lineage_counts, hide_index=True, use_container_width=False)
         else:
             st.write("No lineage data available.")
@@ -1,4 +1,5 @@
 import datetime as dt
+import functools
 import json
 import sys
 from pathlib import Path
@@ -6,7 +7,10 @@ import base64
 import yaml
 import os
 import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import streamlit as st
 from streamlit_option_menu import option_menu
 import streamlit.components.v1 as components
@@ -58,9 +62,141 @@ except Exception as e:
     st.error(f"Error loading or parsing configuration file: {e}")
     st.stop()
 
+try:
+    # orjson parses the (multi-MB) plot files several times faster than the standard library
+    import orjson
+
+    def read_json(path):
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+
+    def write_json(path, data):
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data))
+except ImportError:
+    def read_json(path):
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def write_json(path, data):
+        with open(path, "w") as f:
+            json.dump(data, f)
+
 def visualize(virus):
     return mapping.get(virus.lower())
 
+LOCATION_PATTERN = r"^\s*(?P<continent>[^/]*?)\s*(?:/\s*(?P<country>[^/]*?)\s*)?(?:/|$)"
+
+def observed_value_counts(series):
+    """value_counts without the zero counts that categorical columns report for filtered-out categories"""
+    counts = series.value_counts()
+    return counts[counts > 0]
+
+def split_location(location):
+    """split a "continent / country / ..." location column into stripped continent and country columns"""
+    parts = location.str.extract(LOCATION_PATTERN)
+    return parts["continent"], parts["country"]
+
+def is_letters(text):
+    """non-empty and made of ASCII letters only"""
+    return text.isascii() and text.isalpha()
+
+def classify_mutation(mutation):
+    """
+    kind of a target mutation, from its fixed grammar (no regular expressions needed):
+        -deletion: 12345_12349 or 12345
+        -insertion: 12345_.|ATG
+        -substitution: 12345_T|A
+        -other
+    """
+    position, underscore, change = mutation.partition("_")
+    if not position.isdecimal():
+        return "other"
+    if not underscore or change.isdecimal():
+        return "deletion"
+
+    ref, bar, alt = change.partition("|")
+    if bar and is_letters(alt):
+        if ref == ".":
+            return "insertion"
+        if is_letters(ref):
+            return "substitution"
+    return "other"
+
+# distinct mutations whose kind is remembered (the same mutations recur across cases)
+MUTATION_KIND_CACHE_SIZE = 65536
+
+@st.cache_resource
+def cached_classify_mutation():
+    """
+    classify_mutation behind a bounded lru_cache, shared across reruns and sessions
+    (the app script is re-executed on every rerun, so a cache defined at its top level alone would start empty each time)
+    """
+    return functools.lru_cache(maxsize=MUTATION_KIND_CACHE_SIZE)(classify_mutation)
+
+def mutation_kinds(mutations):
+    """kind of each target mutation, as a list aligned with mutations"""
+    kind = cached_classify_mutation()
+    return [kind(m) for m in mutations]
+
+MUTATION_COLORS = {
+    "deletion":   {"bg": "#ffebee", "fg": "#c62828"},   # red
+    "insertion":  {"bg": "#e8f5e9", "fg": "#2e7d32"},   # green
+    "substitution": {"bg": "#e3f2fd", "fg": "#1565c0"}, # blue
+    "other":      {"bg": "#eeeeee", "fg": "#424242"},   # grey
+}
+
+# opening tag of the chip of each kind of mutation, formatted once
+CHIP_PREFIX = {
+    kind: (
+        f"<span style='background:{style['bg']}; color:{style['fg']}; "
+        f"padding:3px 8px; border-radius:12px; margin:2px; "
+        f"display:inline-block; font-size:90%; font-weight:500'>"
+    )
+    for kind, style in MUTATION_COLORS.items()
+}
+
+def make_chips(texts, kinds):
+    """html of a row of chips, one per text, colored by kind"""
+    return " ".join(CHIP_PREFIX[kind] + text + "</span>" for text, kind in zip(texts, kinds))
+
+# legend of the mutation chips
+LEGEND_HTML = " ".join(
+    CHIP_PREFIX[kind] + label + "</span>"
+    for label, kind in [("Deletion", "deletion"), ("Insertion", "insertion"), ("Substitution", "substitution")]
+)
+
+# number of mutation chips rendered before asking to show the rest
+CHIP_PAGE = 200
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def prepare_target_mutations(target_mutations):
+    """
+    download text and chips html of the target mutations of a report (the comma separated line of target_mutations.txt)
+    built once per list of mutations, so reruns of the page (e.g. switching tabs) reuse them
+    only the first CHIP_PAGE chips are in "chips", the others are in "remaining_chips"
+    """
+    mutations = [m.strip() for m in target_mutations.split(",")]
+    kinds = mutation_kinds(mutations)
+    return {
+        "text": "\n".join(mutations),
+        "chips": make_chips(mutations[:CHIP_PAGE], kinds[:CHIP_PAGE]),
+        "remaining": max(len(mutations) - CHIP_PAGE, 0),
+        "remaining_chips": make_chips(mutations[CHIP_PAGE:], kinds[CHIP_PAGE:]),
+    }
+
+def display_mutation_chips(prepared):
+    """
+    display the target mutations as chips, from the values of prepare_target_mutations
+    only the first CHIP_PAGE chips are sent to the browser unless the user asks for the rest,
+    as rendering thousands of html chips freezes the page
+    """
+    st.markdown(prepared["chips"], unsafe_allow_html=True)
+
+    # (a toggle, since expanders cannot be nested in the target mutations expander)
+    if prepared["remaining"] > 0 and st.toggle(f"Show remaining {prepared['remaining']} mutations"):
+        st.markdown(prepared["remaining_chips"], unsafe_allow_html=True)
+
 def loading_animation(virus_name):
     # write text on top of loading animation
     loader_html = f"""
@@ -128,9 +264,43 @@ def discover_viruses():
     # return only the names, not paths
     return [d.name for d in virus_dirs]
 
-@st.cache_data
-def load_master_data(virus):
-    """load and merge master data for the specified virus"""
+# identifiers and labels, always read as strings, never inferred as numbers ("00123" and "1.10" are kept as they are)
+STRING_COLUMNS = ("genomeID", "genomeIDs", "pangoLin")
+
+def read_tsv(path, usecols=None):
+    """
+    read a tsv file with the (multithreaded) pyarrow csv reader, STRING_COLUMNS typed as strings while parsing
+    (read_csv(engine="pyarrow", dtype=...) only casts them after type inference, when "00123" is already 123)
+    """
+    table = pa_csv.read_csv(
+        path,
+        parse_options=pa_csv.ParseOptions(delimiter="\t"),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols or [],
+            column_types={col: pa.string() for col in STRING_COLUMNS},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas()
+
+# parquet snapshots of the loaded master data (see load_master_data), kept with the app, apart from the pipeline results
+MASTER_DATA_CACHE_DIR = PROJECT_ROOT / "app" / ".cache" / "master_data"
+# part of the snapshot file names: bump it whenever load_master_data changes the data it returns
+# (columns, types, row order...), so that snapshots written by older code are never reused
+MASTER_DATA_SNAPSHOT_VERSION = 2
+
+def is_up_to_date(target, sources):
+    """check that target exists and is not older than any of the (existing) sources"""
+    if not target.exists() or not all(source.exists() for source in sources):
+        return False
+    target_mtime = target.stat().st_mtime
+    return all(source.stat().st_mtime <= target_mtime for source in sources)
+
+def locate_master_data(virus):
+    """
+    paths of the master data of a virus: (source file, source columns, recombinant summary file, snapshot file)
+    returns None if the parameters of the virus cannot be loaded
+    """
 
     # load param set
     try:
@@ -145,24 +315,65 @@ def load_master_data(virus):
         st.error(f"Error loading parameters for {virus}: {e}")
         return None
 
+    # locate source data
+    if virus.lower() == "sars-cov-2":
+        # Get analysis window from config to construct the correct filename
+        try:
+            virus_config = config.get(VIRUSES).get(virus)
+            analysis_window_months = virus_config.get("analysis_window_months", 6)
+        except Exception:
+            analysis_window_months = 6
+        
+        source_file = RESULTS_DIR_BASE / NEXTSTRAIN_OUTPUT / virus / f"nextstrain_reformatted_last_{analysis_window_months}_months.tsv"
+        columns = ["genomeID", "Collection date", "Submission date", "Location", "pangoLin"]
+    else:
+        source_file = RESULTS_DIR_BASE / HAPLOCOV_OUTPUT / virus / paramset / "haplocov_reformatted.tsv"
+        columns = ["genomeID", "collectionD", "continent", "country", "pangoLin"]
+
+    # locate recombinant summary
+    recombinant_summary_file_base = RESULTS_DIR_BASE / RECOMBINHUNT_OUTPUT / virus / paramset
+
+    if virus == "sars-cov-2": recombinant_summary_file = recombinant_summary_file_base / ALL / "recombinant_summary.tsv"
+    else:                     recombinant_summary_file = recombinant_summary_file_base / "recombinant_summary.tsv" 
+
+    snapshot_file = MASTER_DATA_CACHE_DIR / f"{virus}_{paramset}_{source_file.stem}_v{MASTER_DATA_SNAPSHOT_VERSION}.parquet"
+
+    return source_file, columns, recombinant_summary_file, snapshot_file
+
+def files_mtime(paths):
+    """latest modification time of the (existing) files, used as part of cache keys so that updated files are reloaded"""
+    return max((os.path.getmtime(path) for path in paths if os.path.exists(path)), default=None)
+
+def master_data_mtime(virus):
+    """latest modification time of the input files of load_master_data"""
+    located = locate_master_data(virus)
+    if located is None:
+        return None
+    source_file, _, recombinant_summary_file, _ = located
+    return files_mtime([source_file, recombinant_summary_file])
+
+@st.cache_resource(max_entries=16)
+def load_master_data(virus, mtime):
+    """
+    load and merge master data for the specified virus
+    mtime (see master_data_mtime) is only part of the cache key, so that updated data are reloaded
+    """
+    located = locate_master_data(virus)
+    if located is None:
+        return None
+    source_file, columns, recombinant_summary_file, snapshot_file = located
+
+    # reuse the parquet snapshot of a previous load if the tsv files did not change since
+    if is_up_to_date(snapshot_file, [source_file, recombinant_summary_file]):
+        try:
+            return pd.read_parquet(snapshot_file)
+        except Exception as e:
+            print(f"Could not read master data snapshot {snapshot_file}, rebuilding it: {e}")
+
     # load source data
     try:
-        if virus.lower() == "sars-cov-2":
-            # Get analysis window from config to construct the correct filename
-            try:
-                virus_config = config.get(VIRUSES).get(virus)
-                analysis_window_months = virus_config.get("analysis_window_months", 6)
-            except Exception:
-                analysis_window_months = 6
-            
-            source_file = RESULTS_DIR_BASE / NEXTSTRAIN_OUTPUT / virus / f"nextstrain_reformatted_last_{analysis_window_months}_months.tsv"
-            columns = ["genomeID", "Collection date", "Submission date", "Location", "pangoLin"]
-        else:
-            source_file = RESULTS_DIR_BASE / HAPLOCOV_OUTPUT / virus / paramset / "haplocov_reformatted.tsv"
-            columns = ["genomeID", "collectionD", "continent", "country", "pangoLin"]
-
         if source_file.exists():
-            source_df = pd.read_csv(source_file, sep="\t", usecols=columns)
+            source_df = read_tsv(source_file, usecols=columns)
         else:
             st.warning(f"Source file not found: {source_file}")
     except Exception as e:
@@ -171,13 +382,8 @@ def load_master_data(virus):
     
     # load recombinant summary
     try:
-        recombinant_summary_file_base = RESULTS_DIR_BASE / RECOMBINHUNT_OUTPUT / virus / paramset
-    
-        if virus == "sars-cov-2": recombinant_summary_file = recombinant_summary_file_base / ALL / "recombinant_summary.tsv"
-        else:                     recombinant_summary_file = recombinant_summary_file_base / "recombinant_summary.tsv" 
-
         if recombinant_summary_file.exists():
-            recombinant_summary_df = pd.read_csv(recombinant_summary_file, sep="\t")
+            recombinant_summary_df = read_tsv(recombinant_summary_file)
             recombinant_summary_df.rename(columns={"genomeIDs": "genomeID"}, inplace=True)
         else:
             st.warning(f"Recombinant summary file not found: {recombinant_summary_file}")
@@ -185,9 +391,14 @@ def load_master_data(virus):
         st.error(f"Error loading recombinant summary for {virus}: {e}")
         return None
 
-    # merge dataframes
+    # merge dataframes (left join on genomeID)
+    # the summary has one row per recombinant genome, so each column is joined
+    # with a hash lookup (Series.map) instead of the generic merge machinery
     try:
-        merged_df = pd.merge(source_df, recombinant_summary_df, on="genomeID", how="left")
+        merged_df = source_df
+        recombinant_summary_df = recombinant_summary_df.drop_duplicates(subset="genomeID").set_index("genomeID")
+        for col in recombinant_summary_df.columns:
+            merged_df[col] = merged_df["genomeID"].map(recombinant_summary_df[col])
     except Exception as e:
         st.error(f"Error merging dataframes for {virus}: {e}")
         return None
@@ -204,43 +415,121 @@ def load_master_data(virus):
     }
     merged_df.rename(columns=mapping, inplace=True)
 
+    # parse collection dates once here (dates are normalised to YYYY-MM-DD during preprocessing)
+    merged_df["collection_date"] = pd.to_datetime(merged_df["collection_date"], format="%Y-%m-%d", errors="coerce")
+
+    # derive/clean continent and country once, so filters and maps can use them directly
+    if "Location" in merged_df.columns:
+        merged_df["continent"], merged_df["country"] = split_location(merged_df["Location"])
+    else:
+        merged_df["continent"] = merged_df["continent"].str.strip()
+        merged_df["country"] = merged_df["country"].str.strip()
+
+    # low-cardinality columns that are repeatedly grouped, counted and filtered on
+    for col in ["pangoLin", "breakpoint_count", "continent", "country", "recombinant_parents"]:
+        if col in merged_df.columns:
+            merged_df[col] = merged_df[col].astype("category")
+
+    # sort once here, newest first, so that time filters can slice instead of sorting/scanning
+    merged_df = merged_df.sort_values("collection_date", ascending=False, ignore_index=True)
+
+    # snapshot for the next cold start (a columnar read is much faster than parsing the tsv files)
+    try:
+        snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        merged_df.to_parquet(snapshot_file)
+    except Exception as e:
+        print(f"Could not write master data snapshot {snapshot_file}: {e}")
+
     return merged_df
 
-@st.cache_data
-def load_consensus_data(virus):
+def consensus_summary_file(virus):
+    """path of the recombinant summary of the consensus sequences (sars-cov-2 only)"""
     if virus == "sars-cov-2":
         dist, size = 0, 0
         paramset = f"dist{dist}size{size}"
-        recombinant_summary_file_base = RESULTS_DIR_BASE / RECOMBINHUNT_OUTPUT / virus / paramset / CONSENSUS / "recombinant_summary.tsv"
+        return RESULTS_DIR_BASE / RECOMBINHUNT_OUTPUT / virus / paramset / CONSENSUS / "recombinant_summary.tsv"
+
+@st.cache_resource(max_entries=4)
+def load_consensus_data(virus, mtime):
+    """load the consensus recombinant summary, mtime is only part of the cache key"""
+    recombinant_summary_file_base = consensus_summary_file(virus)
 
     if recombinant_summary_file_base.exists():
-        df = pd.read_csv(recombinant_summary_file_base, sep="\t")
+        df = read_tsv(recombinant_summary_file_base)
     else:
         st.warning(f"Recombinant summary file not found: {recombinant_summary_file_base}")
         return None
 
     return df
 
-@st.cache_data
-def load_complete_data_stats(virus):
+def compute_complete_data_stats(source_file):
+    """computes the dataset statistics of a complete (not time-windowed) nextstrain source file"""
     stats = {}
+    columns = ["genomeID", "Collection date", "Submission date", "Location", "pangoLin"]
+    df = read_tsv(source_file, usecols=columns)
+    
+    stats["total_records"] = len(df)
+
+    df["Collection date"] = pd.to_datetime(df["Collection date"], format="%Y-%m-%d", errors="coerce")
+    min_date = df["Collection date"].min()
+    max_date = df["Collection date"].max()
+    stats["min_collection_date"] = min_date.strftime("%Y-%m-%d") if pd.notnull(min_date) else "N/A"
+    stats["max_collection_date"] = max_date.strftime("%Y-%m-%d") if pd.notnull(max_date) else "N/A"
+
+    _, country = split_location(df["Location"])
+    stats["unique_countries"] = country.nunique()
+    stats["country_distribution"] = country.value_counts().reset_index()
+    stats["unique_lineages"] = df["pangoLin"].nunique()
+    stats["lineage_distribution"] = df["pangoLin"].value_counts().reset_index()
+
+    return stats
+
+# statistics of the complete source files (see load_complete_data_stats), kept with the master data snapshots
+COMPLETE_DATA_STATS_CACHE_DIR = PROJECT_ROOT / "app" / ".cache" / "complete_data_stats"
+# part of the stats file names: bump it whenever compute_complete_data_stats changes what it returns
+COMPLETE_DATA_STATS_VERSION = 1
+
+def complete_data_file(virus):
+    """path of the complete (not time-windowed) source file (sars-cov-2 only)"""
     if virus == "sars-cov-2":
-        source_file = RESULTS_DIR_BASE / NEXTSTRAIN_OUTPUT / virus / "nextstrain_reformatted.tsv"
-        columns = ["genomeID", "Collection date", "Submission date", "Location", "pangoLin"]
-        df = pd.read_csv(source_file, sep="\t", usecols=columns)
-        
-        stats["total_records"] = len(df)
+        return RESULTS_DIR_BASE / NEXTSTRAIN_OUTPUT / virus / "nextstrain_reformatted.tsv"
 
-        df["Collection date"] = pd.to_datetime(df["Collection date"], errors="coerce")
-        min_date = df["Collection date"].min()
-        max_date = df["Collection date"].max()
-        stats["min_collection_date"] = min_date.strftime("%Y-%m-%d") if pd.notnull(min_date) else "N/A"
-        stats["max_collection_date"] = max_date.strftime("%Y-%m-%d") if pd.notnull(max_date) else "N/A"
+@st.cache_resource(max_entries=4)
+def load_complete_data_stats(virus, mtime):
+    """
+    loads the dataset statistics of the complete source file
+    they are stored in the app cache dir (scalars in a json, distributions in parquet files)
+    and recomputed only when the source file is newer than them
+    mtime is only part of the cache key, so that an updated source file is reloaded
+    """
+    if virus == "sars-cov-2":
+        source_file = complete_data_file(virus)
+        stats_prefix = f"{virus}_{source_file.stem}"
+        stats_suffix = f"_v{COMPLETE_DATA_STATS_VERSION}"
+        stats_file = COMPLETE_DATA_STATS_CACHE_DIR / f"{stats_prefix}_stats{stats_suffix}.json"
+        distribution_files = {
+            "country_distribution": COMPLETE_DATA_STATS_CACHE_DIR / f"{stats_prefix}_country_distribution{stats_suffix}.parquet",
+            "lineage_distribution": COMPLETE_DATA_STATS_CACHE_DIR / f"{stats_prefix}_lineage_distribution{stats_suffix}.parquet",
+        }
+
+        if all(is_up_to_date(f, [source_file]) for f in [stats_file, *distribution_files.values()]):
+            try:
+                stats = read_json(stats_file)
+                for key, distribution_file in distribution_files.items():
+                    stats[key] = pd.read_parquet(distribution_file)
+                return stats
+            except Exception as e:
+                print(f"Could not read the stats of {source_file}, recomputing them: {e}")
 
-        stats["unique_countries"] = df["Location"].apply(lambda x: x.split("/")[1].strip() if isinstance(x, str) else x).nunique()
-        stats["country_distribution"] = df["Location"].apply(lambda x: x.split("/")[1].strip() if isinstance(x, str) else x).value_counts().reset_index()
-        stats["unique_lineages"] = df["pangoLin"].nunique()
-        stats["lineage_distribution"] = df["pangoLin"].value_counts().reset_index()
+        stats = compute_complete_data_stats(source_file)
+
+        try:
+            COMPLETE_DATA_STATS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            write_json(stats_file, {k: v for k, v in stats.items() if k not in distribution_files})
+            for key, distribution_file in distribution_files.items():
+                stats[key].to_parquet(distribution_file)
+        except Exception as e:
+            print(f"Could not store the stats of {source_file}: {e}")
 
         return stats
     else:
@@ -252,7 +541,8 @@ def apply_time_filter(df, virus):
     user can select between three options:
         -no time filtering (returns all data)
         -filter by specific date selections (choose start and end dates: end date defaults to today)
-        -filter by the number of latest X sequences (user inputs an integer number, we sort the dataframe by collection date and return the latest X rows)
+        -filter by the number of latest X sequences (user inputs an integer number, we return the latest X rows)
+    df must be sorted by collection date, newest first and undated rows last (as returned by load_master_data)
     """
     # select filter type
     filter_type = st.pills(
@@ -277,12 +567,14 @@ def apply_time_filter(df, virus):
         download_date = dt.date.today()  # fallback to today if any error occurs
         analysis_window_months = 6
     
+    # dated rows, newest first
+    collection_dates = df["collection_date"].iloc[:df["collection_date"].notna().sum()]
+
     # Calculate the actual date range in the data for reference
     try:
-        collection_dates = pd.to_datetime(df["collection_date"], errors='coerce').dropna()
         if not collection_dates.empty:
-            min_data_date = collection_dates.min().date()
-            max_data_date = collection_dates.max().date()
+            min_data_date = collection_dates.iloc[-1].date()
+            max_data_date = collection_dates.iloc[0].date()
             st.info(f"Data contains collection dates from {min_data_date} to {max_data_date}")
         else:
             st.warning("No valid collection dates found in the data")
@@ -314,46 +606,69 @@ def apply_time_filter(df, virus):
     filtered_df = df
     if filter_type == "Filter by Date Range" and filter_value:
         start_date, end_date = filter_value
-        # convert string df['collection_date'] to datetime object
-        collection_date = pd.to_datetime(df["collection_date"]).dt.date
-
-        filtered_df = df[(collection_date >= start_date) & (collection_date <= end_date)]
+        # binary search of the range bounds on the ascending view of the sorted dates
+        ascending_dates = collection_dates.to_numpy()[::-1]
+        first = ascending_dates.searchsorted(np.datetime64(start_date), side="left")
+        last = ascending_dates.searchsorted(np.datetime64(end_date), side="right")
+        filtered_df = df.iloc[len(ascending_dates) - last:len(ascending_dates) - first]
     elif filter_type == "Filter by Latest Sequences" and filter_value:
-        filtered_df = df.sort_values("collection_date", ascending=False).head(filter_value)
+        # already sorted, newest first
+        filtered_df = df.head(filter_value)
 
     return filtered_df
 
-def create_key_metrics(df):
+def compute_key_metrics(df):
     """
-    creates key metrics as cards for the summary dashboard
+    computes the values shown as key metrics in the summary dashboard
         -# Total Sequences
         -# Recombinant Events
         -Recombination Rate
         -Top Recombinant Lineage
         -Most Common Parents
     """
-    st.title("Key Metrics")
-
     total_sequences = len(df)
     total_recombinants = df["is_recombinant"].sum()
-    num_1BP = df[df["breakpoint_count"] == "1BP"].shape[0]
-    num_2BP = df[df["breakpoint_count"] == "2BP"].shape[0]
+    # one pass over breakpoint_count for both counts
+    bp_counts = df["breakpoint_count"].value_counts()
+    num_1BP = bp_counts.get("1BP", 0)
+    num_2BP = bp_counts.get("2BP", 0)
     recombination_rate = (total_recombinants / total_sequences * 100) if total_sequences > 0 else 0
 
+    # recombinant rows, selected once and reused below
+    recombinants = df.loc[df["is_recombinant"], ["pangoLin", "recombinant_parents"]]
+
     # get top recombinant lineage
     # and top recombinant lineage count
-    top_recombinant_value_counts = df[df["is_recombinant"]]["pangoLin"].value_counts()
+    top_recombinant_value_counts = observed_value_counts(recombinants["pangoLin"])
     top_recombinant_lineage = top_recombinant_value_counts.idxmax() if not top_recombinant_value_counts.empty else "N/A"
     top_recombinant_count = top_recombinant_value_counts.max() if not top_recombinant_value_counts.empty else 0
 
     # get most common parents
     # and most common parents count
-    most_common_parents_value_counts = df[df["is_recombinant"]]["recombinant_parents"].value_counts()
+    most_common_parents_value_counts = observed_value_counts(recombinants["recombinant_parents"])
     most_common_parents = most_common_parents_value_counts.idxmax() if not most_common_parents_value_counts.empty else "N/A"
     most_common_parents_count = most_common_parents_value_counts.max() if not most_common_parents_value_counts.empty else 0
 
     # Calculate unique patterns (unique recombinant parents across all lineages)
-    unique_patterns = df[df["is_recombinant"]]["recombinant_parents"].nunique() if not df[df["is_recombinant"]].empty else 0
+    # value_counts already has one (non-null) entry per pattern
+    unique_patterns = len(most_common_parents_value_counts)
+
+    return {
+        "total_sequences": total_sequences,
+        "total_recombinants": total_recombinants,
+        "num_1BP": num_1BP,
+        "num_2BP": num_2BP,
+        "recombination_rate": recombination_rate,
+        "top_recombinant_lineage": top_recombinant_lineage,
+        "top_recombinant_count": top_recombinant_count,
+        "most_common_parents": most_common_parents,
+        "most_common_parents_count": most_common_parents_count,
+        "unique_patterns": unique_patterns,
+    }
+
+def create_key_metrics(metrics):
+    """creates key metrics as cards for the summary dashboard, from the values of compute_key_metrics"""
+    st.title("Key Metrics")
 
     # Create compact metric cards using custom layout
     col1, col2 = st.columns(2)
@@ -364,7 +679,7 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">Total Sequences</div>
-            <div style="font-size: 1.2rem; font-weight: bold;">{total_sequences:,}</div>
+            <div style="font-size: 1.2rem; font-weight: bold;">{metrics["total_sequences"]:,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -372,7 +687,7 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">Recombinant Sequences</div>
-            <div style="font-size: 1.2rem; font-weight: bold;">{total_recombinants:,}</div>
+            <div style="font-size: 1.2rem; font-weight: bold;">{metrics["total_recombinants"]:,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -380,7 +695,7 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">1BP</div>
-            <div style="font-size: 1.2rem; font-weight: bold;">{num_1BP:,}</div>
+            <div style="font-size: 1.2rem; font-weight: bold;">{metrics["num_1BP"]:,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -388,7 +703,7 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">2BP</div>
-            <div style="font-size: 1.2rem; font-weight: bold;">{num_2BP:,}</div>
+            <div style="font-size: 1.2rem; font-weight: bold;">{metrics["num_2BP"]:,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -396,7 +711,7 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">Unique Patterns</div>
-            <div style="font-size: 1.2rem; font-weight: bold;">{unique_patterns:,}</div>
+            <div style="font-size: 1.2rem; font-weight: bold;">{metrics["unique_patterns"]:,}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -404,7 +719,7 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">Top Recombinant Lineage</div>
-            <div style="font-size: 1.0rem; font-weight: bold;">{top_recombinant_lineage} ({top_recombinant_count})</div>
+            <div style="font-size: 1.0rem; font-weight: bold;">{metrics["top_recombinant_lineage"]} ({metrics["top_recombinant_count"]})</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -412,100 +727,117 @@ def create_key_metrics(df):
         st.markdown(f"""
         <div style="background-color: #f0f2f6; padding: 0.5rem; border-radius: 0.5rem; margin: 0.2rem;">
             <div style="font-size: 0.8rem; color: #666;">Most Common Patterns</div>
-            <div style="font-size: 1.0rem; font-weight: bold;">{most_common_parents} ({most_common_parents_count})</div>
+            <div style="font-size: 1.0rem; font-weight: bold;">{metrics["most_common_parents"]} ({metrics["most_common_parents_count"]})</div>
         </div>
         """, unsafe_allow_html=True)
 
-def create_summary_tables(df):
-    "create summary and hotspots tables"
+def compute_summary_tables(df):
+    """computes the lineage breakdown and recombination hotspots tables"""
+    # create a table
+    # group by each lineage (pangoLin)
+    # count 1BP in breakpoint_count as 1BP Count
+    # rate of 1BP Count / total sequences
+    # count 2BP in breakpoint_count as 2BP Count
+    # rate of 2BP Count / total sequences
+    # rest is No Recombination
+    # total sequences in each lineage
+    # a single lineage x breakpoint_count tabulation, the rest is column arithmetic
+    # (observed=True/reindex keep out the categories absent from the filtered data)
+    total_sequences = df.groupby("pangoLin", observed=True).size()
+    bp_counts = pd.crosstab(df["pangoLin"], df["breakpoint_count"]).reindex(
+        index=total_sequences.index, columns=["1BP", "2BP"], fill_value=0
+    )
+
+    lineage_breakdown = pd.DataFrame({
+        "1BP Count": bp_counts["1BP"],
+        "1BP Rate": bp_counts["1BP"] / total_sequences * 100,
+        "2BP Count": bp_counts["2BP"],
+        "2BP Rate": bp_counts["2BP"] / total_sequences * 100,
+        "No Recombination": total_sequences - bp_counts["1BP"] - bp_counts["2BP"],
+        "Total Sequences": total_sequences,
+    })
+    lineage_breakdown.index.name = "Lineage"
+
+    lineage_breakdown.sort_values(by="1BP Rate", ascending=False, inplace=True)
+
+    # group by recombinant_parents
+    # display frequency
+    recombination_hotspots = df.groupby("recombinant_parents", observed=True).size().reset_index(name="Frequency")
+    recombination_hotspots.rename(columns={"recombinant_parents": "Recombinant Parents"}, inplace=True)
+    recombination_hotspots.set_index("Recombinant Parents", inplace=True)
+    recombination_hotspots.sort_values(by="Frequency", ascending=False, inplace=True)
+
+    return lineage_breakdown, recombination_hotspots
+
+def create_summary_tables(lineage_breakdown, recombination_hotspots):
+    "display summary and hotspots tables, from the tables of compute_summary_tables"
     st.title("Summary Tables")
 
-    with st.spinner("Creating lineage breakdown table..."):
-        st.subheader("Lineage Breakdown")
-        with st.expander("", expanded=True):
-            # create a table
-            # group by each lineage (pangoLin)
-            # count 1BP in breakpoint_count as 1BP Count
-            # rate of 1BP Count / total sequences
-            # count 2BP in breakpoint_count as 2BP Count
-            # rate of 2BP Count / total sequences
-            # rest is No Recombination
-            # total sequences in each lineage
-            lineage_breakdown = df.groupby("pangoLin").agg(
-                BP1_Count=("breakpoint_count", lambda x: (x == "1BP").sum()),
-                BP1_Rate=("breakpoint_count", lambda x: (x == "1BP").mean() * 100 if len(x) > 0 else 0.00),
-                BP2_Count=("breakpoint_count", lambda x: (x == "2BP").sum()),
-                BP2_Rate=("breakpoint_count", lambda x: (x == "2BP").mean() * 100 if len(x) > 0 else 0.00),
-                No_Recombination=("breakpoint_count", lambda x: ((x != "1BP") & (x != "2BP")).sum()),
-                Total_Sequences=("breakpoint_count", "size")
-            ).reset_index()
-
-            lineage_breakdown.rename(columns={
-                "pangoLin": "Lineage",
-                "BP1_Count": "1BP Count",
-                "BP1_Rate": "1BP Rate",
-                "BP2_Count": "2BP Count",
-                "BP2_Rate": "2BP Rate",
-                "No_Recombination": "No Recombination",
-                "Total_Sequences": "Total Sequences"
-            }, inplace=True)
-
-            lineage_breakdown.set_index("Lineage", inplace=True)
-
-            lineage_breakdown.sort_values(by="1BP Rate", ascending=False, inplace=True)
-
-            st.dataframe(
-                lineage_breakdown.style.format({
-                    "1BP Rate": "{:.2f}%",
-                    "2BP Rate": "{:.2f}%"
-                }),
-                use_container_width=True
-            )
+    st.subheader("Lineage Breakdown")
+    with st.expander("", expanded=True):
+        st.dataframe(
+            lineage_breakdown.style.format({
+                "1BP Rate": "{:.2f}%",
+                "2BP Rate": "{:.2f}%"
+            }),
+            use_container_width=True
+        )
+
+    st.subheader("Breakdown of Detected Recombinations")
+    with st.expander("", expanded=True):
+        st.write(recombination_hotspots)
 
-    with st.spinner("Creating recombination hotspots table..."):
-        st.subheader("Breakdown of Detected Recombinations")
-        with st.expander("", expanded=True):
-            # group by recombinant_parents
-            # display frequency
-            recombination_hotspots = df.groupby("recombinant_parents").size().reset_index(name="Frequency")
-            recombination_hotspots.rename(columns={"recombinant_parents": "Recombinant Parents"}, inplace=True)
-            recombination_hotspots.set_index("Recombinant Parents", inplace=True)
-            recombination_hotspots.sort_values(by="Frequency", ascending=False, inplace=True)
-            st.write(recombination_hotspots)
-
-def create_temporal_plot(df, virus):
+def compute_temporal_data(df):
+    """
+    computes the number of sequences and of recombinations per month (or per week, for ranges of up to 180 days)
+    returns (table, period label), or None if collection dates are not available
+    """
     if "collection_date" not in df.columns:
-        st.warning("Collection date information is not available.")
-        return
+        return None
 
-    with st.spinner("Generating temporal distribution plot..."):
-        df = df.dropna(subset=["collection_date"])
-        df["collection_date"] = pd.to_datetime(df["collection_date"])
+    df = df.dropna(subset=["collection_date"])
 
-        date_range = df["collection_date"].max() - df["collection_date"].min()
+    date_range = df["collection_date"].max() - df["collection_date"].min()
 
-        if date_range > pd.Timedelta(days=180):
-            freq = "M" 
-            freq_label = "Month"  
-        else:
-            freq = "W" 
-            freq_label = "Week" 
+    # group on plain datetime64 period starts instead of Period objects
+    collection_date = df["collection_date"]
+    if date_range > pd.Timedelta(days=180):
+        freq_label = "Month"  
+        period_start = collection_date.values.astype("datetime64[M]")
+    else:
+        freq_label = "Week" 
+        # weeks run from Monday to Sunday (same as pandas' weekly periods)
+        week_start = collection_date - pd.to_timedelta(collection_date.dt.dayofweek, unit="D")
+        period_start = week_start.values.astype("datetime64[D]")
 
-        df["year-month"] = df["collection_date"].dt.to_period(freq)
+    monthly_data = df.groupby(period_start)["is_recombinant"].agg(["count", "sum"])
 
-        monthly_data = df.groupby("year-month").agg(
-            {
-                "is_recombinant": ["count", "sum"]
-            }
-        )
+    monthly_data.columns = [
+        "total_sequences", "recombinations"
+    ]
 
-        monthly_data.columns = [
-            "total_sequences", "recombinations"
-        ]
+    # labels are built once per period, formatted like the string form of pandas periods
+    starts = monthly_data.index.values
+    if freq_label == "Month":
+        labels = np.datetime_as_string(starts, unit="M")
+    else:
+        ends = starts + np.timedelta64(6, "D")
+        labels = np.char.add(np.char.add(np.datetime_as_string(starts, unit="D"), "/"), np.datetime_as_string(ends, unit="D"))
+
+    monthly_data = monthly_data.reset_index(drop=True)
+    monthly_data["year-month"] = labels
+
+    return monthly_data, freq_label
 
-        monthly_data = monthly_data.reset_index()
-        monthly_data["year-month"] = monthly_data["year-month"].astype(str)
+def create_temporal_plot(temporal_data, virus):
+    """creates the temporal distribution plot, from the values of compute_temporal_data"""
+    if temporal_data is None:
+        st.warning("Collection date information is not available.")
+        return
+
+    monthly_data, freq_label = temporal_data
 
+    with st.spinner("Generating temporal distribution plot..."):
         fig = go.Figure()
 
         fig.add_trace(
@@ -548,42 +880,66 @@ def create_temporal_plot(df, virus):
 
         st.plotly_chart(fig, width="stretch")
 
-def create_geographic_map(df, virus):
+@st.cache_resource
+def load_country_coordinates():
+    """latitude and longitude of each country in app/country.csv, indexed by country name"""
+    return pd.read_csv("app/country.csv").set_index("country")[["latitude", "longitude"]]
+
+@st.cache_data(persist="disk", show_spinner=False)
+def geocode_country(country):
+    """
+    latitude and longitude of a country missing from app/country.csv
+    results are persisted on disk per country, so each country is looked up online only once
+    raises if the lookup fails (exceptions are not cached: the country is looked up again next time)
+    """
+    print(f"Missing country (will geocode): {country}")
+    location = Nominatim(user_agent="GetLoc").geocode(country)
+    if location is None:
+        raise ValueError(f"no location found for {country}")
+    return location.latitude, location.longitude
+
+def geocode_countries(countries):
+    """coordinates of the countries that could be geocoded (see geocode_country), by country"""
+    coordinates = {}
+    for country in countries:
+        try:
+            coordinates[country] = geocode_country(country)
+        except Exception as e:
+            print(f"Could not geocode {country}: {e}")
+    return coordinates
+
+def compute_geo_data(df):
+    """
+    computes the number of recombinant sequences per country, with the coordinates of each country
+    returns None if there are no recombinant sequences
+    """
     # only keep is_recombinant
     df = df[df["is_recombinant"] == True]
     if df.empty:
-        st.warning("No recombinant sequences found.")
-        return
-
-    with st.spinner("Generating geographic distribution map..."):
-        if virus == "sars-cov-2":
-            df['country'] = df["Location"].apply(lambda x: x.split("/")[1].strip() if isinstance(x, str) else x)
-
-        df['country'] = df['country'].str.strip()
-        geo_data = df["country"].value_counts().reset_index()
-        geo_data.columns = ["country", "count"]
-
-        lat_lon_df = pd.read_csv("app/country.csv")
+        return None
 
-        geo_data = geo_data.merge(lat_lon_df, on="country", how="left")
-        
-        missing_countries = geo_data[geo_data["latitude"].isna()]["country"].tolist()
+    # country is already split/stripped in load_master_data
+    geo_data = observed_value_counts(df["country"]).reset_index()
+    geo_data.columns = ["country", "count"]
 
-        if missing_countries:
-            print("Missing countries (will geocode):", missing_countries)
+    geo_data = geo_data.join(load_country_coordinates(), on="country")
+    
+    missing_countries = geo_data[geo_data["latitude"].isna()]["country"].tolist()
 
-            for country in missing_countries:
-                try:
-                    loc = Nominatim(user_agent="GetLoc")
-                    getLoc = loc.geocode(country)
+    if missing_countries:
+        coordinates = geocode_countries(missing_countries)
+        geo_data["latitude"] = geo_data["latitude"].fillna(geo_data["country"].map({c: lat for c, (lat, _) in coordinates.items()}))
+        geo_data["longitude"] = geo_data["longitude"].fillna(geo_data["country"].map({c: lon for c, (_, lon) in coordinates.items()}))
 
-                    geo_data.loc[geo_data["country"] == country, "latitude"] = getLoc.latitude
-                    geo_data.loc[geo_data["country"] == country, "longitude"] = getLoc.longitude
-                except Exception as e:
-                    print(f"Could not geocode {country}: {e}")
+    return geo_data.dropna(subset=["latitude", "longitude"])
 
-        geo_data = geo_data.dropna(subset=["latitude", "longitude"])
+def create_geographic_map(geo_data):
+    """creates the geographic distribution map, from the values of compute_geo_data"""
+    if geo_data is None:
+        st.warning("No recombinant sequences found.")
+        return
 
+    with st.spinner("Generating geographic distribution map..."):
         fig = px.scatter_mapbox(
             geo_data,
             lat="latitude",
@@ -603,15 +959,15 @@ def create_geographic_map(df, virus):
         with a:
             st.plotly_chart(fig, use_container_width=True)
 
-def create_distribution_plots(df, virus):
+def create_distribution_plots(temporal_data, geo_data, virus):
     "creates temporal and locational distributions"
     st.title("Distribution Plots")
 
     st.subheader("Temporal Distribution")
-    create_temporal_plot(df, virus)
+    create_temporal_plot(temporal_data, virus)
 
     st.subheader("Locational Distribution")
-    create_geographic_map(df, virus)
+    create_geographic_map(geo_data)
 
 def apply_user_filter(df, virus):
     """Apply user-defined filters to the DataFrame."""
@@ -631,78 +987,91 @@ def apply_user_filter(df, virus):
         )
 
     with c:
-        if virus == "sars-cov-2": 
-            df["continent"] = df["Location"].apply(lambda x: x.split("/")[0].strip() if isinstance(x, str) else x)
-            df["country"] = df["Location"].apply(lambda x: x.split("/")[1].strip() if isinstance(x, str) else x)
-        else: df["continent"] = df["continent"].apply(lambda x: x.strip() if isinstance(x, str) else x)
+        # continent and country are already split/stripped in load_master_data
         location_filter = st.selectbox(
             "Select Continent:",
             ["All"] + sorted(df["continent"].dropna().unique().tolist()) if "continent" in df.columns else ["NA"]
         )
 
     # apply filters
+    # predicates are combined into one mask, so the rows are selected only once
+    mask = pd.Series(True, index=df.index)
+
     if lineage_filter not in ["All", "NA"]:
-        df = df[df["pangoLin"] == lineage_filter]
+        mask &= df["pangoLin"] == lineage_filter
 
     if breakpoint_filter not in ["All", "NA"]:
-        df = df[df["breakpoint_count"] == breakpoint_filter]
+        mask &= df["breakpoint_count"] == breakpoint_filter
 
     if location_filter not in ["All", "NA"]:
-        df = df[df["continent"] == location_filter]
+        mask &= df["continent"] == location_filter
 
-    return df
+    return df[mask]
 
-@st.cache_data
-def load_report_data(path):
-    """Load report data from a specified path."""
+def folder_mtime(path):
+    """Latest modification time of a folder and of the files in it (used to invalidate cached reports)."""
+    with os.scandir(path) as entries:
+        return max([os.path.getmtime(path)] + [entry.stat().st_mtime for entry in entries])
+
+@st.cache_data(ttl=3600, max_entries=256)
+def load_report_data(path, mtime):
+    """
+    Load report data from a specified path.
+    mtime (see folder_mtime) is only part of the cache key, so that regenerated reports are reloaded.
+    Plots are not loaded here, only listed: see load_plot.
+    """
     
-    report = {}
+    report = {"path": path}
 
     with st.spinner("Loading detailed report for the genome..."):
+        # list the folder once and sort its files by kind
+        with os.scandir(path) as entries:
+            file_names = [entry.name for entry in entries if entry.is_file()]
+        region_files = sorted(f for f in file_names if f.startswith("region_") and f.endswith("_table.csv"))
+        plot_files = sorted(f for f in file_names if f.startswith("plot_") and f.endswith(".json"))
+
         # load summary.json
-        summary_path = os.path.join(path, "summary.json")
-        if os.path.exists(summary_path):
-            with open(summary_path, "r") as f:
-                report["summary"] = json.load(f)
+        if "summary.json" in file_names:
+            report["summary"] = read_json(os.path.join(path, "summary.json"))
 
         # load all region tables
         # files named region_*_table.csv: 
         # * in [1, 2] if 1BP
         # * in [1, 2, 3] if 2BP
-        region_files = [f for f in os.listdir(path) if f.startswith("region_") and f.endswith("_table.csv")]
-        for region_file in region_files:
-            region_path = os.path.join(path, region_file)
-            if os.path.exists(region_path):
-                with open(region_path, "r") as f:
-                    report[region_file] = pd.read_csv(f)
-
-        # load plots (in json format)
+        # they are collected into a single table, with the region number in the "region" column
+        region_tables = [
+            pd.read_csv(os.path.join(path, region_file)).assign(region=region_file.split("_")[1])
+            for region_file in region_files
+        ]
+        if region_tables:
+            report["region_tables"] = pd.concat(region_tables, ignore_index=True)
+
+        # list plots (in json format), loaded on display by load_plot
         # plot_per_region.json
         # plot_whole_genome.json
-        plot_files = [f for f in os.listdir(path) if f.startswith("plot_") and f.endswith(".json")]
-        for plot_file in plot_files:
-            plot_path = os.path.join(path, plot_file)
-            if os.path.exists(plot_path):
-                with open(plot_path, "r") as f:
-                    report[plot_file] = json.load(f)
+        report["plot_files"] = plot_files
 
         # load target_mutations.txt
-        target_mutations_path = os.path.join(path, "target_mutations.txt")
-        if os.path.exists(target_mutations_path):
-            with open(target_mutations_path, "r") as f:
+        if "target_mutations.txt" in file_names:
+            with open(os.path.join(path, "target_mutations.txt"), "r") as f:
                 report["target_mutations"] = f.read().splitlines()
 
     return report
 
-def format_region_table(df: pd.DataFrame, region: str) -> pd.DataFrame:
+@st.cache_data(ttl=3600, max_entries=256)
+def load_plot(plot_path, mtime):
+    """Load a plot (in json format) of a report. mtime is only part of the cache key."""
+    return read_json(plot_path)
+
+def format_region_table(df: pd.DataFrame) -> pd.DataFrame:
     # Drop index column if it exists (Streamlit shows it by default otherwise)
     df = df.reset_index(drop=True)
 
     # Rename columns according to mapping
+    # (t_ch_MAX is renamed per region when displayed, see display_region_analysis_tables)
     rename_map = {
         "Unnamed: 0": "Alternative Lineage",
         "num_seq": "#Seq",
-        "t_ch_MAX": "max-L1" if region == "1" else "max-L2" if region == "2" else "max-L3",
         "max_CL": "LR",
         "aic": "AIC",
         "PV": "p-value",
@@ -717,22 +1086,17 @@ def format_region_table(df: pd.DataFrame, region: str) -> pd.DataFrame:
     df = df.drop(columns=cols_to_drop, errors="ignore")
 
     # Format p-value column
+    # numbers in scientific notation, non-numeric values kept as text, missing values empty
     if "p-value" in df.columns:
-        def format_pval(x):
-            if x is None or pd.isna(x):
-                return ""
-            try:
-                return f"{float(x):.0e}"  # scientific notation
-            except:
-                return str(x)
-
-        df["p-value"] = df["p-value"].apply(format_pval)
+        pvalues = pd.to_numeric(df["p-value"], errors="coerce")
+        as_text = df["p-value"].astype(str).where(df["p-value"].notna(), "")
+        df["p-value"] = pvalues.map("{:.0e}".format, na_action="ignore").fillna(as_text)
 
     # Replace *, None in C1, C2, C3 with tick mark or empty
     tick = "✔️"
     for c in ["C1", "C2", "C3"]:
         if c in df.columns:
-            df[c] = df[c].apply(lambda x: tick if str(x).strip() == "*" else "")
+            df[c] = np.where(df[c].astype(str).str.strip() == "*", tick, "")
 
     return df
 
@@ -864,138 +1228,30 @@ def  display_detailed_report(report):
         return
 
     # region tables
-    region_tables = {
-        k: v
-        for k, v in report.items()
-        if k.startswith("region_") and isinstance(v, pd.DataFrame)
-    }
-
-    information = """
-        Tables report the number of sequences,
-        breakpoint, maximum likelihood ratio. The next columns illustrate the comparison
-        of the candidate with the first of the table: value of one-sided AIC comparison
-        between recombination model and non-recombination model (lower values are
-        when row candidate is similar to the first candidate); p-value of AIC -- without
-        multiple comparison corrections; and three conditions: (C1) marked if p-value is
-        ≥10−5; (C2) marked if row breakpoint is at most one mutation apart from the one of
-        the first candidate; (C3) marked if candidate belongs to the same phylogenetic
-        branch as the first one.
-
-        The most plausible candidates are the ones that have all three conditions (C1, C2, C3) marked.
-    """
-    if region_tables:
-        with st.expander("Region Analysis Tables", expanded=True):
-            st.write(information)
-            for region_name, df in region_tables.items():
-                title_mapping = {
-                    "1": "First",
-                    "2": "Second",
-                    "3": "Third"
-                }
-                region = region_name.split("_")[1]
-                region_title = title_mapping.get(region)
-                st.markdown(f"#### {region_title} Region Candidates")
-
-                # Format table
-                formatted_df = format_region_table(df, region).reset_index(drop=True)
-
-                # --- Filtering UI ---
-                _, col0 = st.columns([11, 5])
-                with col0:
-                    filter_all = st.checkbox("Display only most plausible candidates", value=True, key=f"{region_name}_all")
-                # with col1:
-                #     filter_c1 = st.checkbox("C1", key=f"{region_name}_c1")
-                # with col2:
-                #     filter_c2 = st.checkbox("C2", key=f"{region_name}_c2")
-                # with col3:
-                #     filter_c3 = st.checkbox("C3", key=f"{region_name}_c3")
-
-
-                # --- Apply filters ---
-                filtered_df = formatted_df.copy()
-                if filter_all:
-                    filtered_df = filtered_df[
-                        (filtered_df["C1"] == "✔️") &
-                        (filtered_df["C2"] == "✔️") &
-                        (filtered_df["C3"] == "✔️")
-                    ]
-                # else:
-                #     if filter_c1:
-                #         filtered_df = filtered_df[filtered_df["C1"] == "✔️"]
-                #     if filter_c2:
-                #         filtered_df = filtered_df[filtered_df["C2"] == "✔️"]
-                #     if filter_c3:
-                #         filtered_df = filtered_df[filtered_df["C3"] == "✔️"]
-
-                st.dataframe(filtered_df, use_container_width=True, hide_index=True)
+    display_region_analysis_tables(report)
 
     # plot visualization graphs from JSON
-    plot_files = [f for f in report.keys() if f.startswith("plot_") and f.endswith(".json")]
-    plot_per_region = plot_files[0]
-    if plot_per_region:
-        with st.expander("Visualization", expanded=True):
-            st.markdown(f"#### {plot_per_region.replace('_', ' ').replace('.json', '').title()}")
-            fig = go.Figure(report[plot_per_region])
-            st.plotly_chart(fig, use_container_width=True)
+    display_visualization_section(report)
 
     # target mutations list
     if "target_mutations" in report:
         with st.expander("Target Mutations", expanded=True):
 
-            mutations = [m.strip() for m in report["target_mutations"][0].split(",")]
+            prepared = prepare_target_mutations(report["target_mutations"][0])
 
             # --- Download button ---
-            mutations_text = "\n".join(mutations)
             st.download_button(
                 label="Download Mutations List",
-                data=mutations_text,
+                data=prepared["text"],
                 file_name="target_mutations.txt",
                 mime="text/plain"
             )
 
-            def classify_mutation(mutation: str):
-                # Deletion: 12345_12349 or 12345
-                if re.fullmatch(r"\d+_\d+", mutation) or re.fullmatch(r"\d+", mutation):
-                    return "deletion"
-                # Insertion: 12345_.|ATG
-                elif re.fullmatch(r"\d+_\.\|[A-Za-z]+", mutation):
-                    return "insertion"
-                # Substitution: 12345_T|A
-                elif re.fullmatch(r"\d+_[A-Za-z]+\|[A-Za-z]+", mutation):
-                    return "substitution"
-                else:
-                    return "other"
-
-            colors = {
-                "deletion":   {"bg": "#ffebee", "fg": "#c62828"},   # red
-                "insertion":  {"bg": "#e8f5e9", "fg": "#2e7d32"},   # green
-                "substitution": {"bg": "#e3f2fd", "fg": "#1565c0"}, # blue
-                "other":      {"bg": "#eeeeee", "fg": "#424242"},   # grey
-            }
-
-            def make_chip(text, kind):
-                style = colors[kind]
-                return (
-                    f"<span style='background:{style['bg']}; color:{style['fg']}; "
-                    f"padding:3px 8px; border-radius:12px; margin:2px; "
-                    f"display:inline-block; font-size:90%; font-weight:500'>{text}</span>"
-                )
-
             # --- Legend chips ---
-            legend = " ".join([
-                make_chip("Deletion", "deletion"),
-                make_chip("Insertion", "insertion"),
-                make_chip("Substitution", "substitution"),
-            ])
-            st.markdown(legend, unsafe_allow_html=True)
+            st.markdown(LEGEND_HTML, unsafe_allow_html=True)
 
             # --- Mutation chips ---
-            chips = []
-            for m in mutations:
-                mtype = classify_mutation(m)
-                chips.append(make_chip(m, mtype))
-
-            st.markdown(" ".join(chips), unsafe_allow_html=True)
+            display_mutation_chips(prepared)
 
 @st.dialog("Genome Details", width="large")
 def genome_details_dialog(selected_id, report, virus, analysis_mode):
@@ -1015,12 +1271,8 @@ def genome_details_dialog(selected_id, report, virus, analysis_mode):
     display_target_mutations_section(report)
 
 def display_region_analysis_tables(report):
-    # region tables
-    region_tables = {
-        k: v
-        for k, v in report.items()
-        if k.startswith("region_") and isinstance(v, pd.DataFrame)
-    }
+    # region tables, all regions in a single table (see load_report_data)
+    region_tables = report.get("region_tables")
 
     information = """
         Tables report the number of sequences,
@@ -1035,32 +1287,37 @@ def display_region_analysis_tables(report):
 
         The most plausible candidates are the ones that have all three conditions (C1, C2, C3) marked.
     """
-    if region_tables:
+    if region_tables is not None:
+        # Format all tables at once
+        formatted_tables = format_region_table(region_tables)
+
         with st.expander("Region Analysis Tables", expanded=True):
             st.write(information)
-            for region_name, df in region_tables.items():
-                title_mapping = {
-                    "1": "First",
-                    "2": "Second",
-                    "3": "Third"
-                }
-                region = region_name.split("_")[1]
+            title_mapping = {
+                "1": "First",
+                "2": "Second",
+                "3": "Third"
+            }
+            for region, formatted_df in formatted_tables.groupby("region", sort=True):
                 region_title = title_mapping.get(region)
                 st.markdown(f"#### {region_title} Region Candidates")
 
-                # Format table
-                formatted_df = format_region_table(df, region).reset_index(drop=True)
+                formatted_df = (
+                    formatted_df.drop(columns="region")
+                    .rename(columns={"t_ch_MAX": f"max-L{region}"})
+                    .reset_index(drop=True)
+                )
 
                 # --- Filtering UI ---
                 _, col0 = st.columns([11, 5])
                 with col0:
-                    filter_all = st.checkbox("Display only most plausible candidates", value=True, key=f"{region_name}_all")
+                    filter_all = st.checkbox("Display only most plausible candidates", value=True, key=f"region_{region}_all")
                 # with col1:
-                #     filter_c1 = st.checkbox("C1", key=f"{region_name}_c1")
+                #     filter_c1 = st.checkbox("C1", key=f"region_{region}_c1")
                 # with col2:
-                #     filter_c2 = st.checkbox("C2", key=f"{region_name}_c2")
+                #     filter_c2 = st.checkbox("C2", key=f"region_{region}_c2")
                 # with col3:
-                #     filter_c3 = st.checkbox("C3", key=f"{region_name}_c3")
+                #     filter_c3 = st.checkbox("C3", key=f"region_{region}_c3")
 
 
                 # --- Apply filters ---
@@ -1087,11 +1344,13 @@ def display_region_analysis_tables(report):
 def display_visualization_section(report):
     """Display visualization plots from the report."""
     with st.expander("Visualization", expanded=True):
-        plot_files = [f for f in report.keys() if f.startswith("plot_") and f.endswith(".json")]
+        plot_files = report.get("plot_files", [])
         if plot_files:
+            # only the displayed plot is loaded
             plot_per_region = plot_files[0]
+            plot_path = os.path.join(report["path"], plot_per_region)
             st.markdown(f"#### {plot_per_region.replace('_', ' ').replace('.json', '').title()}")
-            fig = go.Figure(report[plot_per_region])
+            fig = go.Figure(load_plot(plot_path, os.path.getmtime(plot_path)))
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No visualization data available.")
@@ -1100,61 +1359,47 @@ def display_target_mutations_section(report):
     """Display target mutations from the report."""
     with st.expander("Target Mutations", expanded=True):
         if "target_mutations" in report:
-            mutations = [m.strip() for m in report["target_mutations"][0].split(",")]
+            prepared = prepare_target_mutations(report["target_mutations"][0])
             
             # Download button
-            mutations_text = "\n".join(mutations)
             st.download_button(
                 label="Download Mutations List",
-                data=mutations_text,
+                data=prepared["text"],
                 file_name="target_mutations.txt",
                 mime="text/plain"
             )
             
-            # Mutation classification and display
-            def classify_mutation(mutation: str):
-                if re.fullmatch(r"\d+_\d+", mutation) or re.fullmatch(r"\d+", mutation):
-                    return "deletion"
-                elif re.fullmatch(r"\d+_\.\|[A-Za-z]+", mutation):
-                    return "insertion"
-                elif re.fullmatch(r"\d+_[A-Za-z]+\|[A-Za-z]+", mutation):
-                    return "substitution"
-                else:
-                    return "other"
-
-            colors = {
-                "deletion":   {"bg": "#ffebee", "fg": "#c62828"},
-                "insertion":  {"bg": "#e8f5e9", "fg": "#2e7d32"},
-                "substitution": {"bg": "#e3f2fd", "fg": "#1565c0"},
-                "other":      {"bg": "#eeeeee", "fg": "#424242"},
-            }
-
-            def make_chip(text, kind):
-                style = colors[kind]
-                return (
-                    f"<span style='background:{style['bg']}; color:{style['fg']}; "
-                    f"padding:3px 8px; border-radius:12px; margin:2px; "
-                    f"display:inline-block; font-size:90%; font-weight:500'>{text}</span>"
-                )
-
             # Legend chips
-            legend = " ".join([
-                make_chip("Deletion", "deletion"),
-                make_chip("Insertion", "insertion"),
-                make_chip("Substitution", "substitution"),
-            ])
-            st.markdown(legend, unsafe_allow_html=True)
+            st.markdown(LEGEND_HTML, unsafe_allow_html=True)
 
             # Mutation chips
-            chips = []
-            for m in mutations:
-                mtype = classify_mutation(m)
-                chips.append(make_chip(m, mtype))
-
-            st.markdown(" ".join(chips), unsafe_allow_html=True)
+            display_mutation_chips(prepared)
         else:
             st.info("No target mutations data available.")
 
+# columns of the recombinant cases table, by analysis mode (None: genome-level analysis)
+CASES_TABLE_FORMATTERS = {
+    "Consensus Sequence Analysis": {
+        "original_lineage": ("Lineage", {"width": 150}),
+        "breakpoint_count": ("BP Count", {"width": 80}),
+        "recombinant_parents": ("Recombinant Parents", {"width": 250}),
+    },
+    None: {
+        "genomeID": ("Genome ID", PINLEFT),
+        "breakpoint_count": ("BP Count", {"width": 80}),
+        "original_lineage": ("Assigned Lineage", {"width": 150}),
+        "recombinant_parents": ("Recombinant Parents", {"width": 250}),
+        "country": ("Country", {"width": 100}),
+        "collection_date": ("Collection Date", {"width": 100}),
+    },
+}
+
+GRID_CSS = {
+    ".ag-root": {"font-family": "inherit"}, 
+    ".ag-cell": {"font-family": "inherit"},
+    ".ag-header-cell": {"font-family": "inherit"}
+}
+
 def create_recombinant_cases_table(df, virus, analysis_mode):
     """Create a table to display recombinant cases."""
     st.subheader("Recombinant Cases")
@@ -1163,29 +1408,14 @@ def create_recombinant_cases_table(df, virus, analysis_mode):
         st.warning("No recombinant cases found.")
         return
     
+    # show collection dates as plain YYYY-MM-DD in the grid
+    if "collection_date" in df.columns:
+        df = df.assign(collection_date=df["collection_date"].dt.strftime("%Y-%m-%d"))
+
     # Full width table
     with st.spinner("Loading recombinant cases..."):
-        if analysis_mode == "Consensus Sequence Analysis":
-            formatter = {
-                "original_lineage": ("Lineage", {"width": 150}),
-                "breakpoint_count": ("BP Count", {"width": 80}),
-                "recombinant_parents": ("Recombinant Parents", {"width": 250}),
-            }
-        else:
-            formatter = {
-                "genomeID": ("Genome ID", PINLEFT),
-                "breakpoint_count": ("BP Count", {"width": 80}),
-                "original_lineage": ("Assigned Lineage", {"width": 150}),
-                "recombinant_parents": ("Recombinant Parents", {"width": 250}),
-                "country": ("Country", {"width": 100}),
-                "collection_date": ("Collection Date", {"width": 100}),
-            }
-
-        custom_css = {
-            ".ag-root": {"font-family": "inherit"}, 
-            ".ag-cell": {"font-family": "inherit"},
-            ".ag-header-cell": {"font-family": "inherit"}
-        }
+        # genome-level columns unless the consensus formatter is requested
+        formatter = CASES_TABLE_FORMATTERS.get(analysis_mode, CASES_TABLE_FORMATTERS[None])
 
         response = draw_grid(
             df,
@@ -1194,7 +1424,7 @@ def create_recombinant_cases_table(df, virus, analysis_mode):
             selection="single",     
             use_checkbox=True,     
             max_height=600,
-            css=custom_css,
+            css=GRID_CSS,
         )
 
     # Handle table selection and show dialog
@@ -1208,7 +1438,7 @@ def create_recombinant_cases_table(df, virus, analysis_mode):
             
             # Load report data
             path_to_the_case_report_folder = selected["case_report_folder"].iloc[0]
-            report = load_report_data(path_to_the_case_report_folder)
+            report = load_report_data(path_to_the_case_report_folder, folder_mtime(path_to_the_case_report_folder))
             
             # Show dialog with details - handle potential conflicts gracefully
             try:
@@ -1220,11 +1450,21 @@ def create_recombinant_cases_table(df, virus, analysis_mode):
             word = "lineage" if analysis_mode == "Consensus Sequence Analysis" else "genome"
             st.info(f"Select a recombinant {word} from the table above to see its details.")
 
-def sidebar(virus_list):
-    """sidebar navigation for the streamlit"""
+@st.cache_data
+def virus_display_names(viruses):
+    """displayed name of each known virus, mapped once per list of viruses instead of on every rerun"""
+    return {v: visualize(v) for v in viruses if v in mapping}
+
+@st.cache_data
+def virus_by_display_name(viruses):
+    """reverse of virus_display_names: virus of each displayed name"""
+    return {name: v for v, name in virus_display_names(viruses).items()}
+
+def sidebar(display_names):
+    """sidebar navigation for the streamlit, display_names as returned by virus_display_names"""
     with st.sidebar:
 
-        menu_options = ["Home"] + sorted([visualize(v) for v in virus_list if v in mapping.keys()])
+        menu_options = ["Home"] + sorted(display_names.values())
         menu_icons = ["house"] + ["virus2"] * (len(menu_options) - 1)
 
         selected = option_menu(
@@ -1371,6 +1611,88 @@ def show_home_page():
 
 
 
+def compute_summary(df):
+    """everything the summary dashboard shows, computed from the (time filtered) data"""
+    return {
+        "metrics": compute_key_metrics(df),
+        "tables": compute_summary_tables(df),
+        "temporal": compute_temporal_data(df),
+        "geo": compute_geo_data(df),
+    }
+
+@st.cache_resource(max_entries=16)
+def load_summary(virus, mtime, _master_df):
+    """
+    summary of the unfiltered data of a virus
+    computed once per virus (and data mtime) and shared across sessions, as the dashboard opens without time filter
+    """
+    return compute_summary(_master_df)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_filtered_summary(virus, mtime, first_row, last_row, _summary_df):
+    """
+    summary of the time filtered data of a virus
+    apply_time_filter returns a contiguous slice of the (sorted) master data,
+    so the labels of its first and last row identify it and are used as cache key instead of hashing the dataframe
+    """
+    return compute_summary(_summary_df)
+
+@st.fragment
+def summary_dashboard(master_df, virus, mtime):
+    """
+    body of the summary dashboard tab
+    runs as a fragment, so changing the time filter only reruns this tab
+    """
+    # time-based filtering
+    # (kept outside the status below since it renders the filter widgets)
+    summary_df = apply_time_filter(master_df, virus)
+
+    st.markdown("---")
+
+    # compute everything under a single status widget,
+    # then render the results
+    with st.status("Preparing summary...", expanded=False) as status:
+        if summary_df is master_df:
+            # no time filter applied: reuse the precomputed summary of the virus
+            summary = load_summary(virus, mtime, master_df)
+        elif summary_df.empty:
+            summary = compute_summary(summary_df)
+        else:
+            # reused as long as the filter selects the same rows
+            summary = load_filtered_summary(virus, mtime, summary_df.index[0], summary_df.index[-1], summary_df)
+        status.update(label="Summary ready", state="complete")
+
+    metrics = summary["metrics"]
+    lineage_breakdown, recombination_hotspots = summary["tables"]
+
+    # display key metrics
+    create_key_metrics(metrics)
+
+    st.markdown("---")
+
+    # display summary tables
+    create_summary_tables(lineage_breakdown, recombination_hotspots)
+
+    st.markdown("---")
+
+    create_distribution_plots(summary["temporal"], summary["geo"], virus)
+
+@st.fragment
+def recombinant_explorer(master_df, virus):
+    """
+    body of the (genome-level) recombinant explorer tab
+    runs as a fragment, so changing a filter or selecting a row only reruns this tab
+    """
+    # filtering
+    with st.spinner("Applying filters..."):
+        recombinant_df = master_df[master_df["is_recombinant"]]
+        explorer_df = apply_user_filter(recombinant_df, virus,)
+
+    st.markdown("---")
+
+    # create interactive table with radio buttons as the index column
+    create_recombinant_cases_table(explorer_df, virus, None)
+
 def show_virus_page(virus):
     """display virus-specific analysis and visualizations"""
     virus_name = visualize(virus)
@@ -1381,7 +1703,8 @@ def show_virus_page(virus):
 
     # load master data
     with st.spinner(f"Loading data for {virus}..."):
-        master_df = load_master_data(virus)
+        data_mtime = master_data_mtime(virus)
+        master_df = load_master_data(virus, data_mtime)
         loader_placeholder.markdown("<style>.loader-overlay{display:none;}</style>", unsafe_allow_html=True)
 
     if master_df is None or master_df.empty:
@@ -1425,7 +1748,7 @@ def show_virus_page(virus):
             if "sars-cov-2" not in st.session_state.stats:
                 loader_placeholder = st.empty()
                 loader_placeholder.markdown(loading_animation(virus_name), unsafe_allow_html=True)
-                stats = load_complete_data_stats(virus)
+                stats = load_complete_data_stats(virus, files_mtime([complete_data_file(virus)]))
                 st.session_state.stats["sars-cov-2"] = stats
                 loader_placeholder.markdown("<style>.loader-overlay{display:none;}</style>", unsafe_allow_html=True)
             else:
@@ -1438,24 +1761,7 @@ def show_virus_page(virus):
         if virus == "sars-cov-2":
             st.info(f"Due to the vast amount of SARS-CoV-2 data, the Summary Dashboard is limited to the most recent {analysis_window_months} months of sequences. For a comprehensive analysis of available SARS-CoV-2 sequences, please utilize the Recombinant Explorer tabs.")
 
-        # time-based filtering
-        with st.spinner("Applying time filter..."):
-            summary_df = apply_time_filter(master_df, virus)
-
-        st.markdown("---")
-
-        # create key metrics and display
-        with st.spinner("Creating key metrics..."):
-            create_key_metrics(summary_df)
-
-        st.markdown("---")
-
-        # create summary tables and display
-        create_summary_tables(summary_df)
-
-        st.markdown("---")
-
-        create_distribution_plots(summary_df, virus)
+        summary_dashboard(master_df, virus, data_mtime)
 
     # Handle different tab structures based on virus
     if virus == "sars-cov-2":
@@ -1463,35 +1769,19 @@ def show_virus_page(virus):
         with tab2:
             # Last X months analysis (genome-level)
             st.info(f"This tab shows recombinant cases from the last {analysis_window_months} months analysis, allowing for genome-level analysis of the most recent data.")
-            
-            # filtering
-            with st.spinner("Applying filters..."):
-                recombinant_df = master_df[master_df["is_recombinant"]]
-                explorer_df = apply_user_filter(recombinant_df, virus,)
 
-            st.markdown("---")
-
-            # create interactive table with radio buttons as the index column
-            create_recombinant_cases_table(explorer_df, virus, None)
+            recombinant_explorer(master_df, virus)
 
         with tab3:
             # Consensus sequence analysis (lineage-level)
             st.info("This tab shows recombinant cases from consensus sequence analysis. The consensus sequence analysis encompasses all available sequences that belong to the same lineage into a 'consensus sequence' and allows for lineage-level analysis rather than genome-level analysis.")
             
-            df = load_consensus_data(virus)
+            df = load_consensus_data(virus, files_mtime([consensus_summary_file(virus)]))
             create_recombinant_cases_table(df, virus, "Consensus Sequence Analysis")
     else:
         # Other viruses have 3 tabs - original structure
         with tab2:
-            # filtering
-            with st.spinner("Applying filters..."):
-                recombinant_df = master_df[master_df["is_recombinant"]]
-                explorer_df = apply_user_filter(recombinant_df, virus,)
-
-            st.markdown("---")
-
-            # create interactive table with radio buttons as the index column
-            create_recombinant_cases_table(explorer_df, virus, None)
+            recombinant_explorer(master_df, virus)
 
     if "initial_rerun_done" not in st.session_state:
         st.session_state.initial_rerun_done = True
@@ -1501,15 +1791,18 @@ def main():
     # discover available viruses
     viruses = discover_viruses()
 
-    viruses_visualized = [visualize(v) for v in viruses]
+    display_names = virus_display_names(viruses)
+
+    # map displayed names back to virus names
+    display_to_virus = virus_by_display_name(viruses)
 
     # sidebar navigation
-    selected = sidebar(viruses)
+    selected = sidebar(display_names)
 
     if selected == "Home":
         show_home_page()
-    elif selected in viruses_visualized:
-        show_virus_page(viruses[viruses_visualized.index(selected)])
+    elif selected in display_to_virus:
+        show_virus_page(display_to_virus[selected])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,11 +1,15 @@
 # src/00_master/pipeline.py
 
 import argparse
+import os
 import yaml
 from pathlib import Path
 import sys
 import logging
 import subprocess
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Add the project's 'src' directory to the Python path.
 # This allows us to import modules like 'utils' and 'constants'
@@ -13,52 +17,401 @@ SRC_PATH = Path(__file__).resolve().parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
     print("Please ensure 'utils.py' and 'constants.py' exist in the 'src/utils' directory.")
     sys.exit(1)
 
+# Preprocessing steps of each data source, by role (metadata, reference, sequences), in the order they are run.
+# Each step has:
+#   "parallelizable": the step does not read the output of the other parallelizable steps next to it,
+#                     so consecutive parallelizable steps can run concurrently (see group_stages)
+#   "cpu": number of CPUs the step keeps busy while it runs
+PREP_SCRIPTS = {
+    "ncbi": {
+        "metadata": {"script": "src/02_preprocessing/ncbi/prep_metadata_ncbi.py", "parallelizable": True, "cpu": 1},
+        "reference": {"script": "src/02_preprocessing/common/prep_ref.py", "parallelizable": True, "cpu": 1},
+        # filtered with the ids dropped by the metadata step
+        "sequences": {"script": "src/02_preprocessing/common/prep_fasta.py", "parallelizable": False, "cpu": 1},
+    },
+    "nextstrain": {
+        "metadata": {"script": "src/02_preprocessing/nextstrain/prep_metadata_nextstrain.py", "parallelizable": True, "cpu": 1},
+        "reference": {"script": "src/02_preprocessing/common/prep_ref.py", "parallelizable": True, "cpu": 1},
+        "sequences": {"script": "src/02_preprocessing/common/prep_fasta.py", "parallelizable": False, "cpu": 1},
+    },
+    "ftp": {
+        "metadata": {"script": "src/02_preprocessing/ftp/prep_metadata_ftp.py", "parallelizable": True, "cpu": 1},
+        "reference": {"script": "src/02_preprocessing/ftp/fetch_ftp_reference.py", "parallelizable": True, "cpu": 1},
+        # fetches the accession ids written by the metadata step
+        "sequences": {"script": "src/02_preprocessing/ftp/fetch_ftp_sequences_by_id.py", "parallelizable": False, "cpu": 1},
+    },
+}
+
+# metadata of the steps that depend on the previous one (all the steps outside PREP_SCRIPTS)
+SEQUENTIAL_STEP = {"parallelizable": False, "cpu": 1}
+
+# Files (or directories) read and written by each step, keyed by script.
+# The templates are filled in by step_files: {raw_data}, {processed_data}, {results}, {environments}, {samples}
+# are the configured paths, {virus} the virus name, {paramset} its dist/size folder name and {window} its analysis window.
+# A stage is only skipped when its outputs exist, and the size and modification time of its inputs are part of its key.
+STEP_FILES = {
+    "src/01_data_acquisition/fetch_data.py": {
+        "inputs": (),
+        "outputs": ("{raw_data}/{virus}",),
+    },
+    "src/02_preprocessing/ncbi/prep_metadata_ncbi.py": {
+        "inputs": ("{raw_data}/{virus}/raw_metadata.tsv",),
+        "outputs": (
+            "{processed_data}/{virus}/metadata.tsv",
+            "{processed_data}/{virus}/filtered_sequence_ids.txt",
+            "{processed_data}/{virus}/non_classified_sequence_ids.txt",
+        ),
+    },
+    "src/02_preprocessing/nextstrain/prep_metadata_nextstrain.py": {
+        "inputs": ("{raw_data}/{virus}/raw_metadata.tsv",),
+        "outputs": (
+            "{processed_data}/{virus}/metadata.tsv",
+            "{processed_data}/{virus}/filtered_sequence_ids.txt",
+            "{processed_data}/{virus}/non_classified_sequence_ids.txt",
+        ),
+    },
+    "src/02_preprocessing/ftp/prep_metadata_ftp.py": {
+        "inputs": ("{raw_data}/{virus}/raw_metadata.csv",),
+        "outputs": ("{processed_data}/{virus}/metadata.tsv", "{processed_data}/{virus}/{virus}-accession-ids.txt"),
+    },
+    "src/02_preprocessing/common/prep_ref.py": {
+        "inputs": ("{raw_data}/{virus}/reference.fasta",),
+        "outputs": ("{processed_data}/{virus}/reference.fasta",),
+    },
+    "src/02_preprocessing/ftp/fetch_ftp_reference.py": {
+        "inputs": (),
+        "outputs": ("{processed_data}/{virus}/reference.fasta",),
+    },
+    "src/02_preprocessing/common/prep_fasta.py": {
+        "inputs": (
+            "{raw_data}/{virus}/raw_sequences.fasta",
+            "{processed_data}/{virus}/filtered_sequence_ids.txt",
+            "{processed_data}/{virus}/non_classified_sequence_ids.txt",
+        ),
+        "outputs": ("{processed_data}/{virus}/sequences.fasta",),
+    },
+    "src/02_preprocessing/ftp/fetch_ftp_sequences_by_id.py": {
+        "inputs": ("{processed_data}/{virus}/{virus}-accession-ids.txt",),
+        "outputs": ("{processed_data}/{virus}/sequences.fasta",),
+    },
+    "src/03_haplocov/run_haplocov.py": {
+        "inputs": (
+            "{processed_data}/{virus}/metadata.tsv",
+            "{processed_data}/{virus}/sequences.fasta",
+            "{processed_data}/{virus}/reference.fasta",
+        ),
+        "outputs": ("{results}/haplocov_output/{virus}/{paramset}/haplocov_assigned.tsv",),
+    },
+    "src/04_postprocessing/format_haplocov_variations.py": {
+        "inputs": ("{results}/haplocov_output/{virus}/{paramset}/haplocov_assigned.tsv",),
+        "outputs": ("{results}/haplocov_output/{virus}/{paramset}/haplocov_reformatted.tsv",),
+    },
+    "src/04_postprocessing/format_covid_variations.py": {
+        "inputs": ("{processed_data}/{virus}/metadata.tsv",),
+        "outputs": (
+            "{results}/nextstrain_output/{virus}/nextstrain_reformatted.tsv",
+            "{results}/nextstrain_output/{virus}/nextstrain_reformatted_last_{window}_months.tsv",
+        ),
+    },
+    "src/analyse/designation_heatmaps/designation_country-region_match.py": {
+        "inputs": ("{results}/haplocov_output/{virus}/{paramset}/haplocov_reformatted.tsv",),
+        "outputs": ("{results}/haplocov_output/{virus}/{paramset}/distribution-of-designations-over-regions.txt",),
+    },
+    # (sars-cov-2 reads the nextstrain output, the other viruses the haplocov one: the missing one is ignored)
+    "src/05_prepare_recombinhunt/create_environment.py": {
+        "inputs": (
+            "{results}/nextstrain_output/{virus}/nextstrain_reformatted.tsv",
+            "{results}/haplocov_output/{virus}/{paramset}/haplocov_reformatted.tsv",
+        ),
+        "outputs": ("{environments}/{virus}/{paramset}/change2lineage_probability.parquet",),
+    },
+    "src/05_prepare_recombinhunt/create_samples.py": {
+        "inputs": (
+            "{results}/nextstrain_output/{virus}/nextstrain_reformatted.tsv",
+            "{results}/nextstrain_output/{virus}/nextstrain_reformatted_last_{window}_months.tsv",
+            "{results}/haplocov_output/{virus}/{paramset}/haplocov_reformatted.tsv",
+        ),
+        "outputs": ("{samples}/{virus}/{paramset}/samples_total.json",),
+    },
+    "src/06_recombinhunt/run_recombinhunt.py": {
+        "inputs": ("{environments}/{virus}/{paramset}", "{samples}/{virus}/{paramset}"),
+        "outputs": ("{results}/recombinhunt_output/{virus}/{paramset}",),
+    },
+}
+
+# shared modules imported by every step: a change to them changes the key of every stage
+UTILS_DIR = Path("src/utils")
+
+class PipelineStepError(Exception):
+    """A pipeline step could not be started or exited with a non-zero return code."""
+    def __init__(self, command: list, returncode=None, reason: str = ""):
+        self.command = command
+        self.returncode = returncode
+        message = f"Step failed: {' '.join(command)}"
+        if returncode is not None:
+            message += f" (return code {returncode})"
+        if reason:
+            message += f": {reason}"
+        super().__init__(message)
+
 def run_pipeline_step(command: list):
     """
-    Executes a pipeline step as a subprocess and handles errors.
+    Executes a pipeline step as a subprocess.
     The command should be a list of arguments, e.g., ['python3', 'script.py', '--arg', 'value']
+    Raises PipelineStepError if the step fails.
     """
     command_str = " ".join(command)
     logging.info(f"--- Executing: {command_str} ---")
     try:
-        # Using capture_output=True to get stdout/stderr for logging
-        result = subprocess.run(
+        # Stream the output of the step line by line (stderr merged into stdout),
+        # so logs appear in real time and the output is never buffered in memory
+        with subprocess.Popen(
             command,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        if result.stdout:
-            logging.info(f"Stdout from step:\n{result.stdout}")
-        if result.stderr:
-            logging.warning(f"Stderr from step:\n{result.stderr}")
-        logging.info(f"--- Step Succeeded: {command_str} ---")
-        return True
-    except subprocess.CalledProcessError as e:
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1
+        ) as process:
+            for line in process.stdout:
+                logging.info(f"[step] {line.rstrip()}")
+            return_code = process.wait()
+    except OSError as e:
         logging.error(f"--- Step FAILED: {command_str} ---")
-        logging.error(f"Return Code: {e.returncode}")
-        logging.error(f"Stderr:\n{e.stderr}")
-        logging.error(f"Stdout:\n{e.stdout}")
-        return False
+        raise PipelineStepError(command, reason=f"could not start the step ({e})") from e
+
+    if return_code != 0:
+        logging.error(f"--- Step FAILED: {command_str} ---")
+        raise PipelineStepError(command, returncode=return_code)
+
+    logging.info(f"--- Step Succeeded: {command_str} ---")
+
+def run_pipeline_stage(stage: list):
+    """
+    Executes the steps of a stage (commands with no data dependency on each other) concurrently.
+    All the steps are run to completion; raises the PipelineStepError of the first failed step, if any.
+    """
+    if len(stage) == 1:
+        run_pipeline_step(stage[0])
+        return
+
+    # Threads are enough here: each step runs in its own subprocess
+    with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+        futures = [executor.submit(run_pipeline_step, command) for command in stage]
+    for future in futures:
+        future.result()
+
+def group_stages(steps: list, cpus: int) -> list:
+    """
+    Groups the steps, a list of (command, step metadata) in run order, into stages (lists of commands).
+    Consecutive parallelizable steps share a stage as long as their "cpu" total fits in cpus;
+    every other step gets a stage of its own.
+    """
+    stages = []
+    stage_cpu = 0
+    stage_parallelizable = False
+    for command, step in steps:
+        if step["parallelizable"] and stage_parallelizable and stage_cpu + step["cpu"] <= cpus:
+            stages[-1].append(command)
+            stage_cpu += step["cpu"]
+        else:
+            stages.append([command])
+            stage_cpu = step["cpu"]
+            stage_parallelizable = step["parallelizable"]
+    return stages
+
+def step_files(stage: list, virus_name: str, config: dict):
+    """Declared (inputs, outputs) of the steps of a stage (see STEP_FILES), as paths for this virus."""
+    paths_config = config.get(PATHS, {})
+    virus_config = config.get(VIRUSES, {}).get(virus_name, {})
+    haplocov_params = virus_config.get(PARAMETERS, {}).get(HAPLOCOV, {})
+    fields = {
+        RAW_DATA: paths_config.get(RAW_DATA, "data/raw"),
+        PROCESSED_DATA: paths_config.get(PROCESSED_DATA, "data/processed"),
+        RESULTS: paths_config.get(RESULTS, "results"),
+        ENVIRONMENTS: paths_config.get(ENVIRONMENTS, "environments"),
+        SAMPLES: paths_config.get(SAMPLES, "samples"),
+        "virus": virus_name,
+        "paramset": f"{DIST}{haplocov_params.get(DIST, 0)}{SIZE}{haplocov_params.get(SIZE, 0)}",
+        "window": virus_config.get("analysis_window_months", 6),
+    }
+
+    inputs, outputs = [], []
+    for command in stage:
+        files = STEP_FILES.get(command[1], {})
+        inputs.extend(Path(template.format(**fields)) for template in files.get("inputs", ()))
+        outputs.extend(Path(template.format(**fields)) for template in files.get("outputs", ()))
+    return inputs, outputs
+
+def file_signature(path: Path) -> list:
+    """(relative path, size, mtime) of a file, or of every file under a directory; empty if the path is missing"""
+    if path.is_dir():
+        files = sorted(f for f in path.rglob("*") if f.is_file())
+    elif path.exists():
+        files = [path]
+    else:
+        return []
+    signature = []
+    for f in files:
+        stat = f.stat()
+        signature.append([str(f), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+def stage_key(stage: list, inputs: list, previous_key: str) -> str:
+    """
+    Digest identifying a run of a stage: the commands, the content of their scripts and of the shared utils,
+    the size and modification time of the declared inputs and the key of the previous stage
+    (which chains back to the configuration of the virus), so that any upstream change changes the key.
+    """
+    digest = hashlib.sha256(previous_key.encode())
+    for command in stage:
+        digest.update(json.dumps(command[1:]).encode())
+        script = Path(command[1])
+        if script.exists():
+            digest.update(script.read_bytes())
+    for util in sorted(UTILS_DIR.glob("*.py")):
+        digest.update(util.read_bytes())
+    for path in inputs:
+        digest.update(json.dumps([str(path), file_signature(path)]).encode())
+    return digest.hexdigest()
+
+def process_virus(virus_name: str, config: dict, config_file: str, resume: bool = False):
+    """
+    Runs all the pipeline steps for a single virus, logging to a file of its own.
+    Returns True if all the steps succeeded.
+    Viruses have independent inputs and outputs, so this can run in a separate process for each virus.
+
+    Every completed stage leaves a marker file named after its key (see stage_key).
+    With resume=True, the leading stages whose marker and declared outputs (see STEP_FILES) exist are skipped,
+    so re-running a completed (or failed) virus with unchanged scripts, inputs and configuration only runs what is left to do.
+    """
+    # Setup Logging for this entire virus run
+    log_dir = Path(config.get(PATHS, {}).get(LOGS))
+    setup_logging(log_dir=log_dir, log_name_prefix=f"{virus_name}_pipeline_run")
+    
+    logging.info(f"================== STARTING PIPELINE FOR: {virus_name.upper()} ==================")
+    
+    virus_config = config.get(VIRUSES, {}).get(virus_name, {})
+    source = virus_config.get(SOURCE)
+
+    # --- Define the sequence of scripts to run ---
+    # The command is built as a list for subprocess.run
+    python_executable = sys.executable # Use the same python that is running the pipeline
+    
+    # Step 1: Data Acquisition
+    step1_fetch = [python_executable, "src/01_data_acquisition/fetch_data.py", "--virus", virus_name, "--config", config_file]
+    
+    # Step 2: Preprocessing (scripts depend on the source, see PREP_SCRIPTS)
+    if source not in PREP_SCRIPTS:
+        logging.error(f"Unknown source '{source}' for virus '{virus_name}'. Cannot determine preprocessing script.")
+        return False # Skip this virus
+    step2_prep = {
+        role: ([python_executable, step["script"], "--virus", virus_name, "--config", config_file], step)
+        for role, step in PREP_SCRIPTS[source].items()
+    }
+
+    # Step 3: Run HaploCoV
+    step3_run_haplocov = [python_executable, "src/03_haplocov/run_haplocov.py", "--virus", virus_name, "--config", config_file]
+
+    # Step 4: Post-processing
+    step4_postprocess_haplocov = [python_executable, "src/04_postprocessing/format_haplocov_variations.py", "--virus", virus_name, "--config", config_file]
+    step4_postprocess_covid = [python_executable, "src/04_postprocessing/format_covid_variations.py", "--virus", virus_name, "--config", config_file]
+    
+    # Step 4.5: Generate heatmaps (for non-SARS-CoV-2 viruses)
+    haplocov_params = config.get(VIRUSES, {}).get(virus_name, {}).get(PARAMETERS, {}).get(HAPLOCOV, {})
+    if haplocov_params:
+        dist = haplocov_params.get(DIST)
+        size = haplocov_params.get(SIZE)
+        input_file = f"results/haplocov_output/{virus_name}/dist{dist}size{size}/haplocov_reformatted.tsv"
+        step4_5_heatmaps = [python_executable, "src/analyse/designation_heatmaps/designation_country-region_match.py", input_file]
+
+    # Step 5: Prepare for RecombinHunt
+    step5_create_env = [python_executable, "src/05_prepare_recombinhunt/create_environment.py", "--virus", virus_name, "--config", config_file]
+    step5_create_samples = [python_executable, "src/05_prepare_recombinhunt/create_samples.py", "--virus", virus_name, "--config", config_file]
+
+    # Step 6: Run RecombinHunt
+    step6_run_recombinhunt = [python_executable, "src/06_recombinhunt/run_recombinhunt.py", "--virus", virus_name, "--config", config_file]
+
+    # --- Execute the pipeline stage by stage ---
+    # The steps of a stage have no data dependency on each other and run concurrently;
+    # a stage starts only once all the steps of the previous one succeeded.
+    # Stages are built from the metadata of the steps (see PREP_SCRIPTS and group_stages).
+    if virus_name.lower() == "sars-cov-2":
+        pipeline_steps = [
+            (step1_fetch, SEQUENTIAL_STEP),
+            step2_prep["metadata"],
+            (step4_postprocess_covid, SEQUENTIAL_STEP),
+            (step5_create_env, SEQUENTIAL_STEP),
+            (step5_create_samples, SEQUENTIAL_STEP),
+            (step6_run_recombinhunt, SEQUENTIAL_STEP)
+        ]
+    else:
+        pipeline_steps = [
+            (step1_fetch, SEQUENTIAL_STEP),
+            *step2_prep.values(),
+            (step3_run_haplocov, SEQUENTIAL_STEP),
+            (step4_postprocess_haplocov, SEQUENTIAL_STEP),
+            (step4_5_heatmaps, SEQUENTIAL_STEP),
+            (step5_create_env, SEQUENTIAL_STEP),
+            (step5_create_samples, SEQUENTIAL_STEP),
+            (step6_run_recombinhunt, SEQUENTIAL_STEP)
+        ]
+    pipeline_stages = group_stages(pipeline_steps, os.cpu_count() or 1)
+
+    # markers of the completed stages
+    done_dir = Path(config.get(PATHS, {}).get(RESULTS, "results")) / ".pipeline_stages" / virus_name
+    # (the download date is rewritten by every successful download: it would change the key of every stage)
+    hashed_virus_config = {k: v for k, v in virus_config.items() if k != DOWNLOAD_DATE}
+    key = hashlib.sha256(json.dumps([config.get(PATHS, {}), hashed_virus_config], sort_keys=True, default=str).encode()).hexdigest()
+    can_skip = resume
+
+    success = True
+    try:
+        for stage in pipeline_stages:
+            stage_name = "+".join(Path(command[1]).stem for command in stage)
+            inputs, outputs = step_files(stage, virus_name, config)
+            key = stage_key(stage, inputs, key)
+            done_file = done_dir / f"{stage_name}_{key[:16]}.done"
+
+            if can_skip and done_file.exists() and all(output.exists() for output in outputs):
+                logging.info(f"--- Skipping (already completed, up to date): {stage_name} ---")
+                continue
+            # once a stage runs, all the following ones run as well
+            can_skip = False
+
+            run_pipeline_stage(stage)
+
+            done_dir.mkdir(parents=True, exist_ok=True)
+            for old_done_file in done_dir.glob(f"{stage_name}_*.done"):
+                old_done_file.unlink()
+            done_file.touch()
+    except PipelineStepError as e:
+        success = False
+        logging.critical(f"Pipeline for '{virus_name}' failed. {e}")
+        logging.critical("Aborting pipeline for this virus.")
+    
+    logging.info(f"================== PIPELINE FOR {virus_name.upper()} FINISHED ==================\n\n")
+    return success
 
 def main():
     """Main orchestrator for the OpenRecombinHunt pipeline."""
     parser = argparse.ArgumentParser(description="Main orchestrator for the OpenRecombinHunt pipeline.")
     parser.add_argument("--virus", required=True, help="The name of the virus to process, or 'all' to process all viruses in the config.")
     parser.add_argument("--config", default="config/config.yaml", help="Path to the main YAML configuration file.")
+    parser.add_argument("--resume", action="store_true", help="Skip the leading steps that already completed with the same scripts, inputs and configuration and whose outputs still exist (no new data is fetched if the download step completed).")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of viruses to process in parallel (default: 1, sequential). Each virus runs its own multi-threaded tools, so keep this well below the number of CPUs.")
     args = parser.parse_args()
 
     # Load main config
     try:
         config_path = Path(args.config)
-        config = yaml.safe_load(config_path.read_text())
+        config = load_config(config_path)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
@@ -79,94 +432,25 @@ def main():
         viruses_to_process = [args.virus]
 
     # --- Main Loop: Process each virus ---
-    for virus_name in viruses_to_process:
-        # Setup Logging for this entire virus run
-        log_dir = Path(config.get(PATHS, {}).get(LOGS))
-        setup_logging(log_dir=log_dir, log_name_prefix=f"{virus_name}_pipeline_run")
-        
-        logging.info(f"================== STARTING PIPELINE FOR: {virus_name.upper()} ==================")
-        
-        virus_config = config.get(VIRUSES, {}).get(virus_name, {})
-        source = virus_config.get(SOURCE)
-
-        # --- Define the sequence of scripts to run ---
-        # The command is built as a list for subprocess.run
-        python_executable = sys.executable # Use the same python that is running the pipeline
-        
-        # Step 1: Data Acquisition
-        step1_fetch = [python_executable, "src/01_data_acquisition/fetch_data.py", "--virus", virus_name, "--config", args.config]
-        
-        # Step 2: Preprocessing (Conditional based on source)
-        if source == "ncbi":
-            step2_prep_meta = [python_executable, "src/02_preprocessing/ncbi/prep_metadata_ncbi.py", "--virus", virus_name, "--config", args.config]
-            step2_prep_fasta = [python_executable, "src/02_preprocessing/common/prep_fasta.py", "--virus", virus_name, "--config", args.config]
-            step2_prep_ref = [python_executable, "src/02_preprocessing/common/prep_ref.py", "--virus", virus_name, "--config", args.config]
-        elif source == "nextstrain":
-            step2_prep_meta = [python_executable, "src/02_preprocessing/nextstrain/prep_metadata_nextstrain.py", "--virus", virus_name, "--config", args.config]
-            step2_prep_fasta = [python_executable, "src/02_preprocessing/common/prep_fasta.py", "--virus", virus_name, "--config", args.config]
-            step2_prep_ref = [python_executable, "src/02_preprocessing/common/prep_ref.py", "--virus", virus_name, "--config", args.config]
-        elif source == "ftp":
-            step2_prep_meta = [python_executable, "src/02_preprocessing/ftp/prep_metadata_ftp.py", "--virus", virus_name, "--config", args.config]
-            step2_prep_fasta = [python_executable, "src/02_preprocessing/ftp/fetch_ftp_sequences_by_id.py", "--virus", virus_name, "--config", args.config]
-            step2_prep_ref = [python_executable, "src/02_preprocessing/ftp/fetch_ftp_reference.py", "--virus", virus_name, "--config", args.config]
-        else:
-            logging.error(f"Unknown source '{source}' for virus '{virus_name}'. Cannot determine preprocessing script.")
-            continue # Skip to the next virus
-
-        # Step 3: Run HaploCoV
-        step3_run_haplocov = [python_executable, "src/03_haplocov/run_haplocov.py", "--virus", virus_name, "--config", args.config]
-
-        # Step 4: Post-processing
-        step4_postprocess_haplocov = [python_executable, "src/04_postprocessing/format_haplocov_variations.py", "--virus", virus_name, "--config", args.config]
-        step4_postprocess_covid = [python_executable, "src/04_postprocessing/format_covid_variations.py", "--virus", virus_name, "--config", args.config]
-        
-        # Step 4.5: Generate heatmaps (for non-SARS-CoV-2 viruses)
-        haplocov_params = config.get(VIRUSES, {}).get(virus_name, {}).get(PARAMETERS, {}).get(HAPLOCOV, {})
-        if haplocov_params:
-            dist = haplocov_params.get(DIST)
-            size = haplocov_params.get(SIZE)
-            input_file = f"results/haplocov_output/{virus_name}/dist{dist}size{size}/haplocov_reformatted.tsv"
-            step4_5_heatmaps = [python_executable, "src/analyse/designation_heatmaps/designation_country-region_match.py", input_file]
-
-        # Step 5: Prepare for RecombinHunt
-        step5_create_env = [python_executable, "src/05_prepare_recombinhunt/create_environment.py", "--virus", virus_name, "--config", args.config]
-        step5_create_samples = [python_executable, "src/05_prepare_recombinhunt/create_samples.py", "--virus", virus_name, "--config", args.config]
-
-        # Step 6: Run RecombinHunt
-        step6_run_recombinhunt = [python_executable, "src/06_recombinhunt/run_recombinhunt.py", "--virus", virus_name, "--config", args.config]
-
-        # --- Execute the pipeline sequentially ---
-        if virus_name.lower() == "sars-cov-2":
-            pipeline_steps = [
-                step1_fetch,
-                step2_prep_meta,
-                step4_postprocess_covid,
-                step5_create_env,
-                step5_create_samples,
-                step6_run_recombinhunt
-            ]
-        else:
-            pipeline_steps = [
-                step1_fetch,
-                step2_prep_meta,
-                step2_prep_fasta,
-                step2_prep_ref,
-                step3_run_haplocov,
-                step4_postprocess_haplocov,
-                step4_5_heatmaps,
-                step5_create_env,
-                step5_create_samples,
-                step6_run_recombinhunt
-            ]
-            
-        for step_command in pipeline_steps:
-            success = run_pipeline_step(step_command)
-            if not success:
-                logging.critical(f"Pipeline for '{virus_name}' failed at step: {' '.join(step_command)}")
-                logging.critical("Aborting pipeline for this virus.")
-                break # Stop processing this virus and move to the next one
-        
-        logging.info(f"================== PIPELINE FOR {virus_name.upper()} FINISHED ==================\n\n")
+    if args.jobs > 1 and len(viruses_to_process) > 1:
+        # Viruses are independent: process them in parallel, one worker process per virus
+        # (each worker sets up its own logging, so every virus keeps its own log file)
+        max_workers = min(args.jobs, len(viruses_to_process))
+        print(f"Processing {len(viruses_to_process)} viruses with {max_workers} parallel workers.")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(process_virus, virus_name, config, args.config, args.resume): virus_name for virus_name in viruses_to_process}
+            for future in as_completed(futures):
+                virus_name = futures[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    print(f"Error: Pipeline for '{virus_name}' crashed: {e}", file=sys.stderr)
+                    continue
+                if not success:
+                    print(f"Error: Pipeline for '{virus_name}' failed. See its log file for details.", file=sys.stderr)
+    else:
+        for virus_name in viruses_to_process:
+            process_virus(virus_name, config, args.config, args.resume)
 
 if __name__ == "__main__":
     main()
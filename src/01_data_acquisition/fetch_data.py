@@ -1,9 +1,9 @@
 # src/01_data_acquisition/fetch_data.py
 
 import argparse
+import os
 import yaml
-import requests
-import zipfile
+import urllib3
 import lzma
 import gzip
 import shutil
@@ -11,7 +11,14 @@ from pathlib import Path
 import sys
 import logging
 import zstandard as zstd
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows: the download date updates are then not serialized
+    fcntl = None
 
 # Add the project's 'src' directory to the Python path.
 SRC_PATH = Path(__file__).resolve().parent.parent
@@ -19,7 +26,7 @@ sys.path.append(str(SRC_PATH))
 
 try:
     # Import from utils.py which is in the same 'src' directory.
-    from utils.utils import setup_logging, run_command, find_and_rename
+    from utils.utils import setup_logging, run_command, find_and_rename, extract_zip_members, fetch_reference_fasta, REFERENCE_CACHE_DIR, COPY_BUFFER_SIZE, load_config, config_cache_path, SafeLoader, SafeDumper
     # Import all constants from the constants file
     from utils.constants import *
 except ImportError as e:
@@ -27,27 +34,62 @@ except ImportError as e:
     print("Please ensure 'src/utils.py' and 'src/constants.py' exist and the script is run from the project root.")
     sys.exit(1)
 
+# Shared by all the downloads of a run, so connections to the same host are reused (thread-safe)
+HTTP_POOL = urllib3.PoolManager()
+
+# Read size used when decompressing zstd downloads
+ZSTD_READ_SIZE = 1024 * 1024
+
+# One zstd decompression context per thread, reused by every download made from that thread
+# (ZstdDecompressor instances must not be shared by concurrent downloads)
+_zstd_contexts = threading.local()
+
+def zstd_decompressor() -> zstd.ZstdDecompressor:
+    """Returns this thread's reusable zstd decompression context."""
+    decompressor = getattr(_zstd_contexts, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd_contexts.decompressor = zstd.ZstdDecompressor()
+    return decompressor
+
 # --- Main Fetching Logic Functions ---
 
 def update_download_date(config_path: str, virus_name: str):
-    """Update the download_date for a virus in the config.yaml file."""
+    """
+    Update the download_date for a virus in the config.yaml file.
+    Viruses downloaded in parallel update the same file: the read-modify-write is done under an exclusive
+    lock (on a '.lock' file next to it), and the new content is written to a temporary file renamed over
+    the config, so that other steps reading it never see a truncated or partial file.
+    """
+    config_path = Path(config_path)
     try:
-        # Read the current config
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
-        
-        # Update the download_date for the specific virus
-        if VIRUSES in config and virus_name in config[VIRUSES]:
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            config[VIRUSES][virus_name]["download_date"] = current_date
-            
-            # Write the updated config back to file
-            with open(config_path, 'w') as f:
-                yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+        with open(config_path.with_name(f"{config_path.name}.lock"), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # Read the current config (under the lock: includes the updates of the other viruses)
+            with open(config_path, 'r') as f:
+                config = yaml.load(f, Loader=SafeLoader)
             
-            logging.info(f"Updated download_date for {virus_name} to {current_date}")
-        else:
-            logging.warning(f"Could not find virus '{virus_name}' in config to update download_date")
+            # Update the download_date for the specific virus
+            if VIRUSES in config and virus_name in config[VIRUSES]:
+                current_date = datetime.now().strftime("%Y-%m-%d")
+                config[VIRUSES][virus_name][DOWNLOAD_DATE] = current_date
+                
+                # Write the updated config to a temporary file, then replace the config with it
+                temp_path = config_path.with_name(f"{config_path.name}.{os.getpid()}.tmp")
+                try:
+                    with open(temp_path, 'w') as f:
+                        yaml.dump(config, f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+                    shutil.copymode(config_path, temp_path)
+                    os.replace(temp_path, config_path)
+                finally:
+                    temp_path.unlink(missing_ok=True)
+                # drop the parsed copy of the old config kept by load_config
+                config_cache_path(config_path).unlink(missing_ok=True)
+                
+                logging.info(f"Updated download_date for {virus_name} to {current_date}")
+            else:
+                logging.warning(f"Could not find virus '{virus_name}' in config to update download_date")
             
     except Exception as e:
         logging.error(f"Failed to update download_date in config: {e}")
@@ -60,40 +102,45 @@ def download_and_decompress(url: str, final_filename: str, virus_raw_dir: Path):
 
         logging.info(f"Downloading from {url}")
         
-        # Determine temporary filename and decompression method
+        # Determine decompression method: the download is decompressed on the fly,
+        # without spooling the compressed file to disk first
         if url.endswith(".gz"):
-            temp_path = virus_raw_dir / f"temp_{final_filename}.gz"
-            decompressor = gzip.open
+            decompressor = lambda raw: gzip.GzipFile(fileobj=raw, mode="rb")
         elif url.endswith(".zst"):
-            temp_path = virus_raw_dir / f"temp_{final_filename}.zst"
-            decompressor = zstd.open
+            decompressor = lambda raw: zstd_decompressor().stream_reader(raw, read_size=ZSTD_READ_SIZE, read_across_frames=True)
         elif url.endswith(".xz"):
-            temp_path = virus_raw_dir / f"temp_{final_filename}.xz"
-            decompressor = lzma.open
+            decompressor = lambda raw: lzma.LZMAFile(raw, mode="rb")
         else:
             logging.warning(f"Unrecognized compression format for URL: {url}. Assuming no compression.")
-            temp_path = virus_raw_dir / final_filename
             decompressor = None
 
         final_path = virus_raw_dir / final_filename
+        # Written next to the final file and renamed at the end,
+        # so a failed download never leaves a truncated file in place of the previous one
+        partial_path = virus_raw_dir / f"{final_filename}.part"
 
         try:
-            with requests.get(url, stream=True) as r:
-                r.raise_for_status()
-                with open(temp_path, 'wb') as f:
-                    shutil.copyfileobj(r.raw, f)
-
-            if decompressor:
-                logging.info(f"Decompressing {temp_path}...")
-                with decompressor(temp_path, 'rb') as f_in:
-                    with open(final_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                temp_path.unlink() # Delete the compressed file
+            # decode_content undoes any HTTP transfer encoding, the file compression is handled by the decompressor
+            r = HTTP_POOL.request("GET", url, preload_content=False, decode_content=True)
+            try:
+                if r.status >= 400:
+                    raise urllib3.exceptions.HTTPError(f"{r.status} {r.reason} for url: {url}")
+                with open(partial_path, 'wb') as f_out:
+                    if decompressor:
+                        logging.info("Decompressing while downloading...")
+                        with decompressor(r) as f_in:
+                            shutil.copyfileobj(f_in, f_out, length=COPY_BUFFER_SIZE)
+                    else:
+                        shutil.copyfileobj(r, f_out, length=COPY_BUFFER_SIZE)
+            finally:
+                r.release_conn()
+            partial_path.replace(final_path)
             
             logging.info(f"Successfully created {final_path}")
 
         except Exception as e:
             logging.error(f"Failed to download or process {url}: {e}")
+            partial_path.unlink(missing_ok=True)
 
 def fetch_reference_sequence(virus_config: dict, global_config: dict, virus_raw_dir: Path):
     """
@@ -106,49 +153,33 @@ def fetch_reference_sequence(virus_config: dict, global_config: dict, virus_raw_
         logging.warning("No reference accession_id found in config. Skipping reference download.")
         return
 
-    # Create a dedicated temporary directory for the reference download
-    temp_ref_dir = virus_raw_dir / "temp_ref_download"
-    temp_ref_dir.mkdir(exist_ok=True)
-
-    try:
-        # Run download command in the dedicated 'ref' subdirectory
-        ncbi_ref_commands = global_config.get(NCBI_CLI, {}).get(REFERENCE, [])
-        for command_template in ncbi_ref_commands:
-            command = command_template.format(
-                accession_id=ref_accession,
-                virus_name=virus_config[NAME]
-            )
-            run_command(command, temp_ref_dir)
-            
-        ref_zip_path = temp_ref_dir / f"{virus_config[NAME]}-reference.zip"
-        logging.info(f"Unzipping {ref_zip_path}...")
-        with zipfile.ZipFile(ref_zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_ref_dir)
-            
-        # Find and rename the reference file from the 'ref' subdirectory
-        unzipped_data_path = temp_ref_dir / "ncbi_dataset" / "data"
-        find_and_rename(unzipped_data_path, "genomic.fna", "reference.fasta", virus_raw_dir)
-
-    finally:
-        # Clean up the temporary reference directory
-        logging.info("Cleaning up temporary reference sequence files...")
-        if temp_ref_dir.exists():
-            shutil.rmtree(temp_ref_dir)
+    ncbi_ref_commands = global_config.get(NCBI_CLI, {}).get(REFERENCE, [])
+    cache_dir = Path(global_config.get(PATHS, {}).get(RAW_DATA, 'data/raw')) / REFERENCE_CACHE_DIR
+    fetch_reference_fasta(ncbi_ref_commands, ref_accession, virus_config[NAME], cache_dir, virus_raw_dir / "reference.fasta")
 
 def fetch_from_ncbi(virus_config: dict, global_config: dict, virus_raw_dir: Path):
     """Handles the entire data acquisition process for NCBI-sourced viruses."""
     logging.info("Starting NCBI data acquisition via CLI...")
-    
-    # Create a temporary directory for the main dataset download
-    temp_complete_dir = virus_raw_dir / "temp_complete_download"
-    temp_complete_dir.mkdir(exist_ok=True)
 
-    try:
-        # 1. Download and process main sequences and metadata
-        logging.info("Step 1: Downloading main dataset...")
-        ncbi_seq_commands = global_config.get(NCBI_CLI, {}).get(SEQUENCES, [])
-        
-        if len(ncbi_seq_commands) >= 2:
+    ncbi_seq_commands = global_config.get(NCBI_CLI, {}).get(SEQUENCES, [])
+    if len(ncbi_seq_commands) < 2:
+        logging.error("NCBI CLI configuration for sequences is incomplete. Expected at least 2 commands.")
+        return
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # 2. The reference sequence does not depend on the main dataset: download it meanwhile
+        logging.info("Step 2: Downloading reference sequence...")
+        reference_future = executor.submit(fetch_reference_sequence, virus_config, global_config, virus_raw_dir)
+
+        # Create a temporary directory for the main dataset download
+        temp_complete_dir = virus_raw_dir / "temp_complete_download"
+        temp_complete_dir.mkdir(exist_ok=True)
+        sequences_future = None
+
+        try:
+            # 1. Download and process main sequences and metadata
+            logging.info("Step 1: Downloading main dataset...")
+
             # Step 1.1: Run the download command in the 'complete' subdirectory
             download_command_template = ncbi_seq_commands[0]
             download_command = download_command_template.format(
@@ -157,11 +188,16 @@ def fetch_from_ncbi(virus_config: dict, global_config: dict, virus_raw_dir: Path
             )
             run_command(download_command, temp_complete_dir)
             
-            # Step 1.2: Unzip the downloaded file
+            # Step 1.2: Unzip the downloaded file: only the data report read by dataformat is kept in the
+            # 'complete' subdirectory, and the sequences go straight to their final name while dataformat runs
             main_zip_path = temp_complete_dir / f"{virus_config[NAME]}-download.zip"
             logging.info(f"Unzipping {main_zip_path}...")
-            with zipfile.ZipFile(main_zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_complete_dir)
+            extract_zip_members(main_zip_path, {
+                "data_report.jsonl": temp_complete_dir / "ncbi_dataset" / "data" / "data_report.jsonl",
+            })
+            sequences_future = executor.submit(
+                extract_zip_members, main_zip_path, {"genomic.fna": virus_raw_dir / "raw_sequences.fasta"}
+            )
 
             # Step 1.3: Run the dataformat command
             format_command_template = ncbi_seq_commands[1]
@@ -169,24 +205,21 @@ def fetch_from_ncbi(virus_config: dict, global_config: dict, virus_raw_dir: Path
                 virus_name=virus_config[NAME]
             )
             run_command(format_command, temp_complete_dir)
-        else:
-            logging.error("NCBI CLI configuration for sequences is incomplete. Expected at least 2 commands.")
-            return
+            sequences_future.result()
 
-        # Move and rename the final standardized files from the 'complete' subdirectory
-        unzipped_data_path = temp_complete_dir / "ncbi_dataset" / "data"
-        find_and_rename(unzipped_data_path, "genomic.fna", "raw_sequences.fasta", virus_raw_dir)
-        find_and_rename(temp_complete_dir, f"{virus_config[NAME]}-raw-metadata.tsv", "raw_metadata.tsv", virus_raw_dir)
+            # Move and rename the metadata written by dataformat
+            find_and_rename(temp_complete_dir, f"{virus_config[NAME]}-raw-metadata.tsv", "raw_metadata.tsv", virus_raw_dir)
 
-    finally:
-        logging.info("Step 3: Cleaning up temporary files...")
-        if temp_complete_dir.exists():
-            shutil.rmtree(temp_complete_dir)
-        logging.info("Cleanup complete.")
+        finally:
+            # The sequences are extracted from the zip in the temporary directory: wait for them before removing it
+            if sequences_future is not None:
+                wait([sequences_future])
+            logging.info("Step 3: Cleaning up temporary files...")
+            if temp_complete_dir.exists():
+                shutil.rmtree(temp_complete_dir)
+            logging.info("Cleanup complete.")
 
-    # 2. Download and process reference sequence by calling the new helper function
-    logging.info("Step 2: Downloading reference sequence...")
-    fetch_reference_sequence(virus_config, global_config, virus_raw_dir)
+        reference_future.result()
 
 def fetch_from_nextstrain(virus_config: dict, global_config: dict, virus_raw_dir: Path):
     """Handles data acquisition for Nextstrain-sourced viruses via URL."""
@@ -254,20 +287,26 @@ def fetch_from_nextstrain(virus_config: dict, global_config: dict, virus_raw_dir
     #     except Exception as e:
     #         logging.error(f"Failed to download or process sequences: {e}")
 
-    # 1. Download and decompress metadata
-    logging.info("Step 1: Downloading metadata...")
-    metadata_url = virus_urls.get(METADATA)
-    download_and_decompress(metadata_url, "raw_metadata.tsv", virus_raw_dir)
-
-    if not virus_name == "sars-cov-2":
-        # 2. Download and decompress sequences
-        logging.info("Step 2: Downloading sequences...")
-        sequences_url = virus_urls.get(SEQUENCES)
-        download_and_decompress(sequences_url, "raw_sequences.fasta", virus_raw_dir)
-
-        # 3. Download reference sequence from NCBI using its accession ID
-        logging.info("Step 3: Fetching reference sequence from NCBI...")
-        fetch_reference_sequence(virus_config, global_config, virus_raw_dir)
+    # The downloads are independent and network-bound: run them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        # 1. Download and decompress metadata
+        logging.info("Step 1: Downloading metadata...")
+        metadata_url = virus_urls.get(METADATA)
+        futures = [executor.submit(download_and_decompress, metadata_url, "raw_metadata.tsv", virus_raw_dir)]
+
+        if not virus_name == "sars-cov-2":
+            # 2. Download and decompress sequences
+            logging.info("Step 2: Downloading sequences...")
+            sequences_url = virus_urls.get(SEQUENCES)
+            futures.append(executor.submit(download_and_decompress, sequences_url, "raw_sequences.fasta", virus_raw_dir))
+
+            # 3. Download reference sequence from NCBI using its accession ID
+            logging.info("Step 3: Fetching reference sequence from NCBI...")
+            futures.append(executor.submit(fetch_reference_sequence, virus_config, global_config, virus_raw_dir))
+
+        # Re-raise the first failure, if any (download_and_decompress logs its own errors)
+        for future in futures:
+            future.result()
         
 def fetch_from_ftp(virus_config: dict, global_config: dict, virus_raw_dir: Path):
     """Handles data acquisition for FTP-sourced viruses."""
@@ -300,8 +339,7 @@ def main():
 
     # Load main config
     try:
-        with open(args.config, 'r') as f:
-            config = yaml.safe_load(f)
+        config = load_config(args.config)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
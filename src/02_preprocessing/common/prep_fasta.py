@@ -1,10 +1,11 @@
 # src/02_preprocessing/ncbi/prep_fasta_ncbi.py
 
 import argparse
+import mmap
+import os
 from pathlib import Path
 import sys
 import logging
-import yaml
 from typing import Set
 
 # Add the project's 'src' directory to the Python path.
@@ -12,22 +13,27 @@ SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config, link_or_copy, COPY_BUFFER_SIZE
     from utils.constants import *
-    from Bio import SeqIO
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
-    print("Please ensure Biopython is installed ('pip install biopython').")
     sys.exit(1)
 
-def load_ids_from_file(filepath: Path) -> Set[str]:
-    """Loads sequence IDs from a text file into a set, ignoring empty lines."""
+def load_ids_from_file(filepath: Path, ids_set: Set[bytes] = None) -> Set[bytes]:
+    """
+    Loads sequence IDs from a text file into a set, ignoring empty lines.
+    If ids_set is given, the IDs are added to it in place (no intermediate set) and it is returned.
+    The IDs are kept as bytes: smaller than str objects, and compared as-is with the FASTA headers.
+    """
     logging.info(f"Loading IDs from: {filepath}")
+    if ids_set is None:
+        ids_set = set()
+    initial_size = len(ids_set)
     try:
-        with open(filepath, 'r') as f:
-            # Use a set comprehension for efficiency
-            ids_set = {line.strip() for line in f if line.strip()}
-        logging.info(f"Loaded {len(ids_set)} unique IDs.")
+        with open(filepath, 'rb') as f:
+            # one C-level strip per line, no generator frame
+            ids_set.update(filter(None, map(bytes.strip, f)))
+        logging.info(f"Loaded {len(ids_set) - initial_size} new unique IDs.")
         return ids_set
     except FileNotFoundError:
         logging.error(f"Required ID file not found at {filepath}")
@@ -41,34 +47,95 @@ def load_ids_from_file(filepath: Path) -> Set[str]:
 def filter_fasta_file(
     input_fasta_path: Path,
     output_fasta_path: Path,
-    ids_to_drop_set: Set[str]
+    ids_to_drop_set: Set[bytes]
 ):
     """
     Filters an input FASTA file, writing sequences to the output path
     only if their ID is NOT in the ids_to_drop_set.
+
+    The file is memory-mapped and scanned as raw bytes: records start at a ">" at the beginning of a line,
+    the ID is the header up to the first whitespace (as Biopython's record.id), and kept records are copied
+    through unchanged, straight from the mapping. No per-record objects are built and nothing is held in memory.
     """
     logging.info(f"Filtering FASTA file: {input_fasta_path}...")
     logging.info(f"Removing sequences whose ID is in the combined dropped list ({len(ids_to_drop_set)} total IDs).")
     
-    kept_records = []
+    if not ids_to_drop_set:
+        # Nothing to drop: the output is the input, link it instead of rewriting it
+        logging.info("No IDs to drop: linking the input FASTA file as the output.")
+        try:
+            link_or_copy(input_fasta_path, output_fasta_path)
+        except FileNotFoundError:
+            logging.error(f"Input FASTA file not found at {input_fasta_path}")
+            sys.exit(1)
+        except Exception as e:
+            logging.error(f"An error occurred during FASTA processing: {e}", exc_info=True)
+            sys.exit(1)
+        logging.info(f"Filtered FASTA saved to  : {output_fasta_path}")
+        return
+
     original_count = 0
     kept_count = 0
 
+    # Written next to the output and renamed over it once complete: the output may be a hard link to the
+    # input (left by an earlier run with nothing to drop), and opening it for writing would truncate both
+    partial_path = Path(output_fasta_path).with_name(f"{Path(output_fasta_path).name}.part")
+
     try:
-        with open(input_fasta_path, "r") as handle_in:
-            for record in SeqIO.parse(handle_in, "fasta"):
-                original_count += 1
-                # The record.id from Biopython typically gives the main identifier before any spaces.
-                # For NCBI FASTA files, this is usually the accession number.
-                sequence_id = record.id
-                
-                if sequence_id not in ids_to_drop_set:
-                    kept_records.append(record)
-                    kept_count += 1
-        
-        # Write all kept records in one go for efficiency
-        with open(output_fasta_path, "w") as handle_out:
-            SeqIO.write(kept_records, handle_out, "fasta")
+        with open(input_fasta_path, "rb") as handle_in, open(partial_path, "wb", buffering=COPY_BUFFER_SIZE) as handle_out:
+            size = os.fstat(handle_in.fileno()).st_size
+            # An empty file cannot be mapped (and has no records)
+            if size:
+                with mmap.mmap(handle_in.fileno(), 0, access=mmap.ACCESS_READ) as mapping, memoryview(mapping) as view:
+                    # The file is read once, front to back: ask for aggressive readahead
+                    if hasattr(mapping, "madvise"):
+                        mapping.madvise(mmap.MADV_SEQUENTIAL)
+                    find = mapping.find
+                    write = handle_out.write
+                    is_dropped = ids_to_drop_set.__contains__
+
+                    # Anything before the first record is skipped, as Biopython does
+                    if mapping[:1] == b">":
+                        record_start = 0
+                    else:
+                        record_start = find(b"\n>")
+                        if record_start != -1:
+                            record_start += 1
+
+                    # Consecutive kept records are written as one slice of the mapping (no copy):
+                    # a write happens only when a run of kept records ends.
+                    # position: start of the pending run of kept records
+                    keep = False
+                    position = 0
+                    while record_start != -1:
+                        header_end = find(b"\n", record_start + 1)
+                        if header_end == -1:
+                            header_end = size
+
+                        original_count += 1
+                        header = mapping[record_start + 1:header_end].split(None, 1)
+                        record_kept = not is_dropped(header[0] if header else b"")
+                        if record_kept != keep:
+                            if keep:
+                                write(view[position:record_start])
+                            else:
+                                position = record_start
+                            keep = record_kept
+                        if keep:
+                            kept_count += 1
+
+                        record_start = find(b"\n>", header_end)
+                        if record_start != -1:
+                            record_start += 1
+
+                    if keep:
+                        write(view[position:size])
+
+                # The raw FASTA is not read again: drop its pages instead of keeping them in the page cache
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(handle_in.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+        os.replace(partial_path, output_fasta_path)
 
     except FileNotFoundError:
         logging.error(f"Input FASTA file not found at {input_fasta_path}")
@@ -76,12 +143,16 @@ def filter_fasta_file(
     except Exception as e:
         logging.error(f"An error occurred during FASTA processing: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        partial_path.unlink(missing_ok=True)
 
-    logging.info(f"FASTA Filtering Summary:")
-    logging.info(f"  Original sequences read: {original_count}")
-    logging.info(f"  Sequences dropped      : {original_count - kept_count}")
-    logging.info(f"  Sequences kept         : {kept_count}")
-    logging.info(f"Filtered FASTA saved to  : {output_fasta_path}")
+    # The summary lines are only formatted if INFO messages are actually logged
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info(f"FASTA Filtering Summary:")
+        logging.info(f"  Original sequences read: {original_count}")
+        logging.info(f"  Sequences dropped      : {original_count - kept_count}")
+        logging.info(f"  Sequences kept         : {kept_count}")
+        logging.info(f"Filtered FASTA saved to  : {output_fasta_path}")
 
 def main():
     """Main function to run the FASTA preprocessing."""
@@ -90,7 +161,7 @@ def main():
     parser.add_argument("--config", default="config/config.yaml", help="Path to the main YAML configuration file.")
     args = parser.parse_args()
 
-    config = yaml.safe_load(Path(args.config).read_text())
+    config = load_config(args.config)
     
     log_dir = Path(config.get(PATHS, {}).get(LOGS, 'logs'))
     setup_logging(log_dir=log_dir, log_name_prefix=f"{args.virus}_02.2_prep_fasta")
@@ -106,18 +177,14 @@ def main():
     non_classified_ids_file = processed_dir / "non_classified_sequence_ids.txt"
     output_fasta = processed_dir / "sequences.fasta"
 
-    # 1. Load both sets of IDs to be dropped
+    # 1. Load both lists of IDs to be dropped straight into a single master set
     logging.info("Loading IDs of sequences to be dropped...")
-    filtered_ids = load_ids_from_file(filtered_ids_file)
-    non_classified_ids = load_ids_from_file(non_classified_ids_file)
-    logging.info(f"NUmber of Filtered IDs: {len(filtered_ids)}")
-    logging.info(f"Number of Non-Classified IDs: {len(non_classified_ids)}")
-
-    # 2. Combine them into a single master set
-    master_drop_set = filtered_ids.union(non_classified_ids)
+    master_drop_set = load_ids_from_file(filtered_ids_file)
+    logging.info(f"NUmber of Filtered IDs: {len(master_drop_set)}")
+    load_ids_from_file(non_classified_ids_file, master_drop_set)
     logging.info(f"Total unique IDs to drop from FASTA file: {len(master_drop_set)}")
 
-    # 3. Filter the FASTA file
+    # 2. Filter the FASTA file
     filter_fasta_file(input_fasta, output_fasta, master_drop_set)
 
     logging.info("Script finished successfully.")
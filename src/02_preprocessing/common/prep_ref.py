@@ -5,14 +5,13 @@ from pathlib import Path
 import sys
 import logging
 import yaml
-import shutil
 
 # Add the project's 'src' directory to the Python path.
 SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config, link_or_copy
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -22,13 +21,15 @@ except ImportError as e:
 def copy_reference_sequence(source_path: Path, destination_path: Path):
     """
     Copies the reference sequence from the raw data directory to the processed directory.
+    The reference is only read downstream, so it is hard-linked when both directories are on the same
+    filesystem, and copied otherwise (see link_or_copy).
     """
     logging.info(f"Copying reference sequence...")
     logging.info(f"  Source: {source_path}")
     logging.info(f"  Destination: {destination_path}")
     
     try:
-        shutil.copy(source_path, destination_path)
+        link_or_copy(source_path, destination_path)
         logging.info("Reference sequence successfully copied to processed directory.")
     except FileNotFoundError:
         logging.error(f"Source reference file not found at '{source_path}'. Cannot copy.")
@@ -45,7 +46,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        config = yaml.safe_load(Path(args.config).read_text())
+        config = load_config(args.config)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
@@ -4,16 +4,13 @@ import argparse
 from pathlib import Path
 import sys
 import logging
-import yaml
-import shutil
-import zipfile
 
 # Add the project's 'src' directory to the Python path.
 SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging, run_command, find_and_rename
+    from utils.utils import setup_logging, fetch_reference_fasta, REFERENCE_CACHE_DIR, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -39,44 +36,16 @@ def fetch_reference_step(virus_name: str, config: dict):
 
     logging.info(f"Found reference accession ID: {ref_accession}")
 
-    # --- 3. Create Temporary Working Directory ---
-    temp_work_dir = processed_dir / "temp_fetch_reference"
-    temp_work_dir.mkdir(exist_ok=True)
-    logging.info(f"Created temporary working directory: {temp_work_dir}")
+    # --- 3. Get Download Command ---
+    ftp_ref_commands = config.get(FTP_CLI, {}).get(REFERENCE, [])
+    if not ftp_ref_commands:
+        logging.error("No reference download commands found in config under 'ftp-cli'.")
+        raise ValueError("Missing CLI command in config.")
 
-    try:
-        # --- 4. Get and Execute Download Command ---
-        ftp_ref_commands = config.get(FTP_CLI, {}).get(REFERENCE, [])
-        if not ftp_ref_commands:
-            logging.error("No reference download commands found in config under 'ftp-cli'.")
-            raise ValueError("Missing CLI command in config.")
-
-        command_template = ftp_ref_commands[0]
-        command = command_template.format(
-            accession_id=ref_accession,
-            virus_name=virus_name
-        )
-        
-        run_command(command, working_dir=temp_work_dir)
-
-        # --- 5. Unzip and Finalize Output ---
-        zip_filename = f"{virus_name}-reference.zip"
-        zip_filepath = temp_work_dir / zip_filename
-        
-        logging.info(f"Unzipping {zip_filepath}...")
-        with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
-            zip_ref.extractall(temp_work_dir)
-            
-        # Find the .fna file, rename it to reference.fasta, and move it to the final destination
-        unzipped_data_path = temp_work_dir / "ncbi_dataset" / "data"
-        find_and_rename(unzipped_data_path, "*.fna", "reference.fasta", processed_dir)
-
-    finally:
-        # --- 6. Cleanup ---
-        logging.info("Cleaning up temporary working directory...")
-        if temp_work_dir.exists():
-            shutil.rmtree(temp_work_dir)
-        logging.info("Cleanup complete.")
+    # --- 4. Download (or reuse the cached archive) and Write reference.fasta ---
+    # Only the first command is used, as before
+    cache_dir = Path(paths_config.get(RAW_DATA, 'data/raw')) / REFERENCE_CACHE_DIR
+    fetch_reference_fasta(ftp_ref_commands[:1], ref_accession, virus_name, cache_dir, processed_dir / "reference.fasta")
 
 
 def main():
@@ -87,7 +56,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        config = yaml.safe_load(Path(args.config).read_text())
+        config = load_config(args.config)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
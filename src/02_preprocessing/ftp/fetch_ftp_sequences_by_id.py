@@ -5,21 +5,99 @@ import pandas as pd
 from pathlib import Path
 import sys
 import logging
-import yaml
-import shutil
-import zipfile
+import tempfile
+import os
+import threading
+import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the project's 'src' directory to the Python path.
 SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging, run_command, find_and_rename
+    from utils.utils import setup_logging, run_command, extract_zip_members, link_or_copy, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
     sys.exit(1)
 
+# NCBI E-utilities endpoint serving the sequences as FASTA
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+
+# Requests per second allowed by NCBI without and with an API key
+EFETCH_RATE = 3
+EFETCH_RATE_WITH_KEY = 10
+
+class RequestThrottle:
+    """Spaces out the start of requests shared by several threads to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def fetch_sequences_efetch(accession_ids_filepath: Path, output_fasta_filepath: Path, efetch_config: dict):
+    """
+    Downloads the FASTA sequences of the accession IDs listed in accession_ids_filepath from NCBI efetch,
+    in batches of `batch_size` IDs sent by `workers` threads over a pool of kept-alive connections.
+    The batches are written to output_fasta_filepath in the order of the ID list.
+    Raises urllib3.exceptions.HTTPError if a batch cannot be downloaded.
+    """
+    batch_size = int(efetch_config.get(BATCH_SIZE, 500))
+    workers = int(efetch_config.get(WORKERS, 3))
+    api_key = efetch_config.get(API_KEY) or os.environ.get("NCBI_API_KEY")
+
+    with open(accession_ids_filepath) as f:
+        accession_ids = [line.strip() for line in f if line.strip()]
+    batches = [accession_ids[i:i + batch_size] for i in range(0, len(accession_ids), batch_size)]
+    logging.info(f"Downloading {len(accession_ids)} sequences from efetch in {len(batches)} batches ({workers} workers)...")
+
+    # One connection per worker, reused across batches; rate limits and server errors are retried with backoff
+    retries = urllib3.Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+    http = urllib3.PoolManager(maxsize=workers, block=True, retries=retries)
+    throttle = RequestThrottle(EFETCH_RATE_WITH_KEY if api_key else EFETCH_RATE)
+
+    def fetch_batch(batch: list) -> bytes:
+        fields = {"db": "nuccore", "id": ",".join(batch), "rettype": "fasta", "retmode": "text"}
+        if api_key:
+            fields["api_key"] = api_key
+        throttle.wait()
+        # POST: a batch of IDs does not fit in a URL
+        r = http.request("POST", EFETCH_URL, fields=fields, encode_multipart=False)
+        if r.status >= 400:
+            raise urllib3.exceptions.HTTPError(f"{r.status} {r.reason} for url: {EFETCH_URL}")
+        data = r.data
+        if data.strip() and not data.lstrip().startswith(b">"):
+            raise urllib3.exceptions.HTTPError(f"Unexpected efetch response: {data[:200]!r}")
+        return data
+
+    # Written next to the output and renamed over it once complete
+    partial_path = output_fasta_filepath.with_name(f"{output_fasta_filepath.name}.part")
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, open(partial_path, 'wb') as f_out:
+            # map yields the batches in order, each one as soon as it (and the ones before it) is done
+            for i, data in enumerate(executor.map(fetch_batch, batches), start=1):
+                f_out.write(data)
+                if data and not data.endswith(b"\n"):
+                    f_out.write(b"\n")
+                logging.info(f"  Batch {i}/{len(batches)} written.")
+        os.replace(partial_path, output_fasta_filepath)
+    finally:
+        partial_path.unlink(missing_ok=True)
+        http.clear()
+
+    logging.info(f"Sequences saved to: {output_fasta_filepath}")
+
 def fetch_sequences_step(virus_name: str, config: dict):
     """
     Orchestrates the fetching of FASTA sequences based on a list of accession IDs.
@@ -48,17 +126,25 @@ def fetch_sequences_step(virus_name: str, config: dict):
         logging.info(f"Created empty sequences file at: {output_fasta_filepath}")
         return
 
+    # Optional efetch download, in place of the CLI command
+    efetch_config = config.get(FTP_CLI, {}).get(EFETCH, {})
+    if efetch_config.get(ENABLED, False):
+        fetch_sequences_efetch(accession_ids_filepath, output_fasta_filepath, efetch_config)
+        return
+
     # --- 3. Create Temporary Working Directory ---
-    temp_work_dir = processed_dir / "temp_fetch_sequences"
-    temp_work_dir.mkdir(exist_ok=True)
-    logging.info(f"Created temporary working directory: {temp_work_dir}")
+    # A directory of its own for each run, removed with everything in it when the block exits.
+    # It is kept next to the processed data: the accession list can be hard-linked into it, and the
+    # archive does not have to fit in a (possibly small) RAM-backed temporary filesystem.
+    with tempfile.TemporaryDirectory(dir=processed_dir, prefix=f"{virus_name}_fetch_sequences_") as temp_dir:
+        temp_work_dir = Path(temp_dir)
+        logging.info(f"Created temporary working directory: {temp_work_dir}")
 
-    try:
         # --- 4. Prepare for CLI Command ---
         # The NCBI tool expects the input file to be in the current working directory.
-        # So, we copy our accession ID list into the temp directory.
+        # So, we link (or copy) our accession ID list into the temp directory.
         temp_accession_ids_path = temp_work_dir / f"{virus_name}-accession-ids.txt"
-        shutil.copy(accession_ids_filepath, temp_accession_ids_path)
+        link_or_copy(accession_ids_filepath, temp_accession_ids_path)
 
         # Get the command template from the config
         sequence_commands = config.get(FTP_CLI, {}).get(SEQUENCES, {})
@@ -76,19 +162,11 @@ def fetch_sequences_step(virus_name: str, config: dict):
         zip_filename = f"{virus_name}-sequences.zip"
         zip_filepath = temp_work_dir / zip_filename
         
+        # Extract only the .fna file, straight to its final destination as sequences.fasta
         logging.info(f"Unzipping {zip_filepath}...")
-        with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
-            zip_ref.extractall(temp_work_dir)
-            
-        # Find the .fna file, rename it to sequences.fasta, and move it to the final destination
-        find_and_rename(temp_work_dir, "*.fna", "sequences.fasta", processed_dir)
-
-    finally:        
-        # --- 7. Cleanup ---
-        logging.info("Cleaning up temporary working directory...")
-        if temp_work_dir.exists():
-            shutil.rmtree(temp_work_dir)
-        logging.info("Cleanup complete.")
+        extract_zip_members(zip_filepath, {"*.fna": output_fasta_filepath})
+
+    logging.info("Temporary working directory removed.")
 
 def main():
     """Main function to run the sequence fetching step."""
@@ -98,7 +176,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        config = yaml.safe_load(Path(args.config).read_text())
+        config = load_config(args.config)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
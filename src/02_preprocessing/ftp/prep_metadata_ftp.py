@@ -2,10 +2,11 @@
 
 import argparse
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 from pathlib import Path
 import sys
 import logging
-import yaml
 import re
 from typing import Tuple, List
 
@@ -14,12 +15,53 @@ SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config, read_metadata_columns
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
     sys.exit(1)
 
+# Columns of the raw metadata used by the processing (the accession column may be named either way):
+# only these are parsed, as strings (see read_metadata_columns)
+RAW_COLUMNS = {
+    "#Accession", "Accession", "Species", "Genotype", "Segment",
+    "Geo_Location", "Length", "Collection_Date", "Release_Date"
+}
+
+# Source columns kept in the output and their standard names
+COLUMN_MAPPING = {
+    "#Accession": "Virus name",
+    "Collection_Date": "Collection date",
+    "Release_Date": "Submission date",
+    "Geo_Location": "Location"
+}
+
+# --- Filtering Patterns ---
+# Compiled once; each one is matched in a single pass over its column
+GENOTYPE_PATTERN = re.compile(r'H5N1|h5n1')
+# HA, or segment 4 ('segment 4' and 'Segment 4' both contain '4')
+SEGMENT_PATTERN = re.compile(r'HA|4')
+# A North American country: either the whole location (no ':' anywhere) or followed by ':' (e.g. 'USA: Texas')
+GEO_LOCATION_PATTERN = re.compile(r'(?:USA|Canada|Mexico):|^[^:]*(?:USA|Canada|Mexico)[^:]*$')
+
+# Low-cardinality columns, loaded as categoricals
+CATEGORICAL_COLUMNS = ["Species", "Genotype", "Segment", "Geo_Location"]
+# The other columns are loaded as Arrow-backed strings (see read_metadata_columns)
+STRING_DTYPE = pd.ArrowDtype(pa.string())
+
+# --- Filtering Helper Functions ---
+
+def _contains_by_category(series: pd.Series, pattern: re.Pattern) -> np.ndarray:
+    """
+    Like series.str.contains(pattern, na=False), but the pattern is searched once per
+    distinct value (the categories) and the results are spread to the rows through the category codes.
+    Missing values never match.
+    """
+    categorical = series.astype('category')
+    matches = categorical.cat.categories.str.contains(pattern, na=False)
+    # Missing values have code -1, which picks the trailing False
+    return np.append(np.asarray(matches, dtype=bool), False)[categorical.cat.codes.to_numpy()]
+
 # --- Formatting Helper Functions ---
 
 def format_location_column(series: pd.Series) -> pd.Series:
@@ -28,34 +70,42 @@ def format_location_column(series: pd.Series) -> pd.Series:
     if a ':' is present.
     """
     logging.info("  - Formatting 'Location' column...")
-    # Ensure the series is treated as string, handle NAs by filling them
-    # so they are not processed by .str methods.
-    return series.astype(str).str.split(':', n=1).str[0].str.strip()
-
-def _format_single_date(date_str: str) -> str:
+    # Locations repeat a lot across rows: format each distinct value once, then spread the results back.
+    # The values are strings already; missing values become 'nan'.
+    codes, unique_locations = pd.factorize(series)
+    locations = pd.Series(np.append(np.asarray(unique_locations, dtype=object), 'nan'), dtype=STRING_DTYPE)
+    formatted = locations.str.split(':', n=1).list[0].str.strip().array
+    # Missing values have code -1, which picks the trailing 'nan'
+    return pd.Series(formatted.take(codes), index=series.index)
+
+# YYYY, YYYY-MM or YYYY-MM-DD, with year, month and day captured
+# (a pattern string, matched by the Arrow regex kernels, which need named groups for extract)
+DATE_PATTERN = r'^(?P<year>\d{4})(?:-(?P<month>\d{2}))?(?:-(?P<day>\d{2}))?$'
+
+def _format_date_series(series: pd.Series) -> pd.Series:
     """
-    Helper to format a single date string by padding it.
+    Formats a whole column of date strings by padding them, with vectorized string operations.
     - YYYY-MM-DD -> YYYY-MM-DD
     - YYYY-MM    -> YYYY-MM-01
     - YYYY       -> YYYY-01-01
+    Anything else becomes pd.NA.
     """
-    if pd.isna(date_str):
-        return pd.NA
-    
-    date_str = str(date_str).strip().split('T')[0]
-    
-    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', date_str): return date_str
-    elif re.fullmatch(r'\d{4}-\d{2}', date_str): return f"{date_str}-01"
-    elif re.fullmatch(r'\d{4}', date_str): return f"{date_str}-01-01"
-    else: return pd.NA
+    # Dates repeat a lot across rows: format each distinct value once, then spread the results back
+    codes, unique_dates = pd.factorize(series)
+    dates = pd.Series(unique_dates, dtype=STRING_DTYPE).str.strip().str.split('T', n=1).list[0]
+    parts = dates.str.extract(DATE_PATTERN)
+    # (an optional group that did not match is extracted as '', a date that did not match as missing)
+    formatted = parts['year'] + '-' + parts['month'].replace('', '01') + '-' + parts['day'].replace('', '01')
+    # Missing values have code -1, which stays missing
+    return pd.Series(formatted.array.take(codes, allow_fill=True), index=series.index)
 
 def format_date_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Applies standardized date formatting to the relevant columns."""
     logging.info("  - Formatting date columns...")
     if 'Collection date' in df.columns:
-        df['Collection date'] = df['Collection date'].apply(_format_single_date)
+        df['Collection date'] = _format_date_series(df['Collection date'])
     if 'Submission date' in df.columns:
-        df['Submission date'] = df['Submission date'].apply(_format_single_date)
+        df['Submission date'] = _format_date_series(df['Submission date'])
     return df
 
 # --- Main Processing Function ---
@@ -70,24 +120,22 @@ def process_ftp_metadata(df: pd.DataFrame) -> pd.DataFrame:
     # --- 1. Apply Filters ---
     logging.info("Step 1: Applying filtering rules...")
     
-    # To handle potential errors with .str accessor on mixed-type columns,
-    # we convert columns to string type for filtering where needed.
-    df['Genotype'] = df['Genotype'].astype(str)
-    df['Segment'] = df['Segment'].astype(str)
-    df['Geo_Location'] = df['Geo_Location'].astype(str)
-
-    filtered_df = df[
+    # Cheap comparisons first, on the whole table: they leave only a small fraction of the rows
+    candidates = df[
         (df["Species"] == "Alphainfluenzavirus influenzae") &
-        (df["Genotype"].str.contains("H5N1|h5n1", na=False)) &
-        (df["Segment"].str.contains("HA|segment 4|Segment 4|4", na=False)) &
-        (
-            (df["Geo_Location"].str.contains("USA|Canada|Mexico", na=False) & ~df["Geo_Location"].str.contains(":", na=False)) |
-            (df["Geo_Location"].str.contains("USA:|Canada:|Mexico:", na=False) & df["Geo_Location"].str.contains(":", na=False))
-        ) &
-        (df["Length"] > 1672) &
+        (pd.to_numeric(df["Length"], errors='coerce') > 1672).fillna(False) &
         (df["Collection_Date"].notna()) &
         (df["Release_Date"].notna())
-    ].copy()
+    ]
+
+    # The regex filters then only look at the remaining rows, once per distinct value
+    # Only the columns that make it to the output are taken (a new, small DataFrame: no extra copy needed)
+    filtered_df = candidates.loc[
+        _contains_by_category(candidates['Genotype'], GENOTYPE_PATTERN) &
+        _contains_by_category(candidates['Segment'], SEGMENT_PATTERN) &
+        _contains_by_category(candidates['Geo_Location'], GEO_LOCATION_PATTERN),
+        list(COLUMN_MAPPING)
+    ]
     
     logging.info(f"  Filtering complete. Kept {len(filtered_df)} rows out of {initial_rows}.")
 
@@ -97,13 +145,8 @@ def process_ftp_metadata(df: pd.DataFrame) -> pd.DataFrame:
 
     # --- 2. Rename Columns ---
     logging.info("Step 2: Renaming columns to standard format...")
-    column_mapping = {
-        "#Accession": "Virus name",
-        "Collection_Date": "Collection date",
-        "Release_Date": "Submission date",
-        "Geo_Location": "Location"
-    }
-    df_renamed = filtered_df.rename(columns=column_mapping)
+    filtered_df.rename(columns=COLUMN_MAPPING, inplace=True)
+    df_renamed = filtered_df
     
     # --- 3. Create Pango Lineage Column ---
     logging.info("Step 3: Creating 'Pango lineage' column and setting to 'A.1'...")
@@ -114,6 +157,10 @@ def process_ftp_metadata(df: pd.DataFrame) -> pd.DataFrame:
     df_renamed['Location'] = format_location_column(df_renamed['Location'])
     df_formatted = format_date_columns(df_renamed)
 
+    # Include Continent in the Location column.
+    # Add "North America / " to the beginning of the Location values.
+    df_formatted['Location'] = "North America / " + df_formatted['Location']
+
     # --- 5. Select and Order Final Columns ---
     final_columns = [
         "Virus name", "Collection date", "Submission date",
@@ -123,10 +170,6 @@ def process_ftp_metadata(df: pd.DataFrame) -> pd.DataFrame:
     existing_final_columns = [col for col in final_columns if col in df_formatted.columns]
     df_final = df_formatted[existing_final_columns]
 
-    # Include Continent in the Location column.
-    # Add "North America / " to the beginning of the Location values.
-    df_final['Location'] = "North America / " + df_final['Location']
-
     logging.info(f"Processing complete. Final DataFrame has {len(df_final)} rows.")
     return df_final
 
@@ -138,7 +181,7 @@ def main():
     parser.add_argument("--config", default="config/config.yaml", help="Path to the main YAML configuration file.")
     args = parser.parse_args()
 
-    config = yaml.safe_load(Path(args.config).read_text())
+    config = load_config(args.config)
     
     log_dir = Path(config.get(PATHS, {}).get(LOGS, 'logs'))
     setup_logging(log_dir=log_dir, log_name_prefix=f"{args.virus}_02.1_prep_metadata_ftp")
@@ -155,8 +198,7 @@ def main():
 
     logging.info(f"Loading raw metadata from {input_file}...")
     try:
-        # Use comment='#' to handle the '#Accession' column name if it causes issues
-        df_raw = pd.read_csv(input_file, low_memory=False)
+        df_raw = read_metadata_columns(input_file, RAW_COLUMNS, categorical_columns=CATEGORICAL_COLUMNS)
         # If the first column is now 'Accession' instead of '#Accession', fix it
         if 'Accession' in df_raw.columns and '#Accession' not in df_raw.columns:
             df_raw.rename(columns={'Accession': '#Accession'}, inplace=True)
@@ -166,16 +208,19 @@ def main():
         sys.exit(1)
 
     df_processed = process_ftp_metadata(df_raw)
+    # The raw table is not needed anymore: release it before writing the outputs
+    del df_raw
     
     logging.info(f"Saving processed metadata ({len(df_processed)} rows) to {output_file}...")
     df_processed.to_csv(output_file, sep='\t', index=False, na_rep='NA')
 
     # Extract and save the accession IDs for the next step
     if 'Virus name' in df_processed.columns:
-        accession_ids = df_processed['Virus name'].dropna().unique().tolist()
+        accession_ids = df_processed['Virus name'].dropna().unique()
         logging.info(f"Saving {len(accession_ids)} unique accession IDs to {accession_ids_file}...")
         with open(accession_ids_file, 'w') as f:
-            f.write('\n'.join(accession_ids))
+            # one line per ID, written as it goes (no joined copy of the whole list)
+            f.writelines(f"{accession_id}\n" for accession_id in accession_ids)
     else:
         logging.warning("Could not find 'Virus name' column in final DataFrame. Accession ID file will be empty.")
         accession_ids_file.touch() # Create empty file
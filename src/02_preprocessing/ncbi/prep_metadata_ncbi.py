@@ -2,19 +2,20 @@
 
 import argparse
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 from pathlib import Path
 import sys
 import logging
 import re
 from typing import Tuple, List, Set
-import yaml
 
 # Add the project's 'src' directory to the Python path.
 SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config, read_metadata_columns
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -29,85 +30,122 @@ COLUMN_MAPPING = {
 }
 # The primary ID column in the raw NCBI metadata
 SOURCE_ID_COL = "Accession"
+# The raw columns combined into 'Location': region and country
+LOCATION_SOURCE_COLUMNS = ('Geographic Region', 'Geographic Location')
+# The metadata columns are Arrow-backed strings (see read_metadata_columns): the patterns below are
+# pattern strings, matched by the Arrow regex kernels (which need named groups for extract)
+STRING_DTYPE = pd.ArrowDtype(pa.string())
 # Special characters to look for in the ID to drop the row
-SPECIAL_CHARS_PATTERN = re.compile(r'[&/\\:]')
+SPECIAL_CHARS_PATTERN = r'[&/\\:]'
+# YYYY, YYYY-MM or YYYY-MM-DD, with year, month and day captured
+DATE_PATTERN = r'^(?P<year>\d{4})(?:-(?P<month>\d{2}))?(?:-(?P<day>\d{2}))?$'
+
+# Patterns and null-like strings used for the date format statistics
+YMD_PATTERN = r'\d{4}-\d{2}-\d{2}'
+YM_PATTERN = r'\d{4}-\d{2}'
+Y_PATTERN = r'\d{4}'
+NULL_LIKE_VALUES = frozenset({'nan', 'na', 'nat', '<na>', ''})
 
 # --- Placeholder Formatting Functions ---
 
-def _format_single_date(date_str: str) -> str:
+def _parse_other_date(date_str: str) -> str:
+    """
+    Fallback for the dates that are not in YYYY, YYYY-MM or YYYY-MM-DD format:
+    tries pandas to_datetime and returns pd.NA if it fails.
+    """
+    try:
+        return pd.to_datetime(date_str).strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return pd.NA
+
+def _format_unique_dates(unique_dates: pd.Index) -> pd.api.extensions.ExtensionArray:
     """
-    Helper function to format a single date string according to specific rules.
+    Formats the distinct date strings according to specific rules, with vectorized string operations.
     - YYYY-MM-DD -> YYYY-MM-DD
     - YYYY-MM    -> YYYY-MM-01
     - YYYY       -> YYYY-01-01
-    Returns pd.NA for invalid or unparseable formats.
+    Any time part is removed first; other formats go through _parse_other_date.
+    Returns an Arrow string array aligned with unique_dates, with missing values for invalid or unparseable dates
+    (take it with allow_fill=True, so that the code -1 that pd.factorize gives to missing values stays missing).
     """
-    if pd.isna(date_str):
-        return pd.NA
-    
-    date_str = str(date_str).strip()
-    date_str = date_str.split('T')[0] # Remove time part if present
-    
-    # Check for YYYY-MM-DD format
-    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', date_str):
-        return date_str
-    # Check for YYYY-MM format
-    elif re.fullmatch(r'\d{4}-\d{2}', date_str):
-        return f"{date_str}-01"
-    # Check for YYYY format
-    elif re.fullmatch(r'\d{4}', date_str):
-        return f"{date_str}-01-01"
-    else:
-        # As a fallback, try pandas to_datetime for other potential formats
-        # If it fails, return NA
-        try:
-            return pd.to_datetime(date_str).strftime('%Y-%m-%d')
-        except (ValueError, TypeError):
-            return pd.NA
+    dates = pd.Series(unique_dates, dtype=STRING_DTYPE).str.strip().str.split('T', n=1).list[0]
+
+    parts = dates.str.extract(DATE_PATTERN)
+    # (an optional group that did not match is extracted as '', a date that did not match as missing)
+    formatted = parts['year'] + '-' + parts['month'].replace('', '01') + '-' + parts['day'].replace('', '01')
+
+    # Only the (few) distinct dates in other formats are parsed one by one
+    other_mask = parts['year'].isna() & dates.notna()
+    if other_mask.any():
+        formatted[other_mask] = dates[other_mask].map(_parse_other_date)
+
+    return formatted.array
 
 def format_date_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Applies standardized date formatting to the relevant columns and logs format statistics.
+    Dates repeat a lot across rows and between the two columns: both columns are factorized together,
+    each distinct value is analyzed and formatted once, and the results are spread back to the rows.
     """
     logging.info("Formatting date columns...")
     
-    date_cols_to_process = ['Collection date', 'Submission date']
-    
-    for col_name in date_cols_to_process:
-        if col_name in df.columns:
-            logging.info(f"  - Analyzing and formatting '{col_name}'")
-            
-            # --- New Logging Logic ---
-            # Work with a string representation of the series for pattern matching
-            series_str = df[col_name].astype(str)
-            
-            # Count initial NAs by checking for pandas NA and common null-like strings
-            na_mask = df[col_name].isna() | series_str.str.lower().isin(['nan', 'na', 'nat', '<na>', ''])
-            na_count = na_mask.sum()
-            
-            # Analyze only the non-NA part of the series
-            non_na_series = series_str[~na_mask]
-            
-            ymd_count = non_na_series.str.fullmatch(r'\d{4}-\d{2}-\d{2}', na=False).sum()
-            ym_count = non_na_series.str.fullmatch(r'\d{4}-\d{2}', na=False).sum()
-            y_count = non_na_series.str.fullmatch(r'\d{4}', na=False).sum()
-            
-            # Count how many will fall into the 'else' block (unparseable or other formats)
-            else_count = len(non_na_series) - (ymd_count + ym_count + y_count)
-
-            logging.info(f"    Date format statistics for '{col_name}':")
-            logging.info(f"      YYYY-MM-DD format: {ymd_count}")
-            logging.info(f"      YYYY-MM format   : {ym_count}")
-            logging.info(f"      YYYY format      : {y_count}")
-            logging.info(f"      Other/unparseable: {else_count}")
-            logging.info(f"      Missing (NA)     : {na_count}")
-            # --- End of New Logging Logic ---
-
-            # Apply the transformation to each cell in the column
-            df[col_name] = df[col_name].apply(_format_single_date)
+    date_cols_to_process = [col for col in ['Collection date', 'Submission date'] if col in df.columns]
+    if not date_cols_to_process:
+        return df
+
+    codes, unique_dates = pd.factorize(pd.concat([df[col] for col in date_cols_to_process], ignore_index=True))
+    formatted = _format_unique_dates(unique_dates)
+
+    # --- New Logging Logic ---
+    # Format statistics of each distinct value, counted per column below.
+    # The distinct values are strings already (and never missing): they are matched as they are
+    unique_str = pd.Series(unique_dates, dtype=STRING_DTYPE)
+    # Null-like strings count as missing, like actual missing values (code -1)
+    is_na = unique_str.str.lower().isin(NULL_LIKE_VALUES).to_numpy()
+    is_ymd = unique_str.str.fullmatch(YMD_PATTERN, na=False).to_numpy() & ~is_na
+    is_ym = unique_str.str.fullmatch(YM_PATTERN, na=False).to_numpy() & ~is_na
+    is_y = unique_str.str.fullmatch(Y_PATTERN, na=False).to_numpy() & ~is_na
+
+    n_rows = len(df)
+    for i, col_name in enumerate(date_cols_to_process):
+        logging.info(f"  - Analyzing and formatting '{col_name}'")
+        col_codes = codes[i * n_rows:(i + 1) * n_rows]
+
+        # Number of rows holding each distinct value
+        counts = np.bincount(col_codes[col_codes >= 0], minlength=len(unique_dates))
+        na_count = int((col_codes < 0).sum() + counts[is_na].sum())
+        ymd_count = int(counts[is_ymd].sum())
+        ym_count = int(counts[is_ym].sum())
+        y_count = int(counts[is_y].sum())
+
+        # Count how many will fall into the 'else' block (unparseable or other formats)
+        else_count = n_rows - na_count - (ymd_count + ym_count + y_count)
+
+        logging.info(f"    Date format statistics for '{col_name}':")
+        logging.info(f"      YYYY-MM-DD format: {ymd_count}")
+        logging.info(f"      YYYY-MM format   : {ym_count}")
+        logging.info(f"      YYYY format      : {y_count}")
+        logging.info(f"      Other/unparseable: {else_count}")
+        logging.info(f"      Missing (NA)     : {na_count}")
+        # --- End of New Logging Logic ---
+
+        # Transform the whole column at once
+        df[col_name] = pd.Series(formatted.take(col_codes, allow_fill=True), index=df.index)
             
     return df
 
+def _factorize_as_str(df: pd.DataFrame, col: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Factorizes a column into (codes, distinct values as strings), with codes indexing the values.
+    Missing values become 'nan' (the distinct values are strings already); a missing column is all empty strings.
+    """
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.intp), np.array([''], dtype=object)
+    codes, uniques = pd.factorize(df[col])
+    values = np.append(np.asarray(uniques, dtype=object), 'nan')
+    # Missing values have code -1: point them to the trailing 'nan'
+    return np.where(codes < 0, len(values) - 1, codes), values
+
 def format_location_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     Combines 'Geographic Region' and 'Geographic Location' into a single 'Location' column.
@@ -115,29 +153,26 @@ def format_location_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     logging.info("Formatting 'Location' column by combining 'Geographic Region' and 'Geographic Location'...")
     
-    region_col = 'Geographic Region'
-    country_col = 'Geographic Location'
+    region_col, country_col = LOCATION_SOURCE_COLUMNS
 
-    # Handle potentially missing columns by creating empty Series if needed
-    region_series = df[region_col].astype(str).fillna('') if region_col in df.columns else pd.Series([''] * len(df), index=df.index)
-    country_series = df[country_col].astype(str).fillna('') if country_col in df.columns else pd.Series([''] * len(df), index=df.index)
-    country_series = country_series.str.split(':', n=1).str[0].str.strip()
+    # Only a few hundred (region, country) pairs occur: each distinct pair is combined once
+    # and the results are spread back to the rows
+    region_codes, region_values = _factorize_as_str(df, region_col)
+    country_codes, country_values = _factorize_as_str(df, country_col)
+    pair_codes, unique_pairs = pd.factorize(region_codes * len(country_values) + country_codes)
 
-    # Combine using apply
-    def combine_location(row):
-        region = row['region']
-        country = row['country']
-        if region and country:
-            return f"{region} / {country}"
-        elif region:
-            return region
-        elif country:
-            return country
-        else:
-            return pd.NA # Use pandas NA for missing location
+    region_series = pd.Series(region_values[unique_pairs // len(country_values)], dtype=object)
+    country_series = pd.Series(country_values[unique_pairs % len(country_values)], dtype=object)
+    country_series = country_series.str.split(':', n=1).str[0].str.strip()
 
-    # Create the new 'Location' series using your logic
-    location_series = pd.DataFrame({'region': region_series, 'country': country_series}).apply(combine_location, axis=1)
+    # Combine column-wise: 'region / country' if both are present, else whichever is present, else NA
+    has_region = region_series != ''
+    has_country = country_series != ''
+    unique_locations = (region_series + ' / ' + country_series).where(
+        has_region & has_country,
+        region_series.where(has_region, country_series.where(has_country, pd.NA))
+    )
+    location_series = pd.Series(pd.array(unique_locations, dtype=STRING_DTYPE).take(pair_codes), index=df.index)
     
     # Assign the new series to the 'Location' column of the DataFrame
     df['Location'] = location_series
@@ -152,44 +187,49 @@ def process_ncbi_metadata(df: pd.DataFrame, filter_rules: list, source_lineage_c
     """
     Applies a full preprocessing workflow to the raw NCBI metadata.
     """
-    df_processed = df.copy()
-    
     # --- 1. Apply Quality & Special Character Filters ---
     logging.info("Step 1: Applying quality filters from config and checking for special characters in ID...")
-    filtered_ids = set()
+
+    # Every filter is evaluated against the original frame and accumulated into a single keep mask:
+    # the rows are sliced only once, at the end, instead of after each rule
+    keep = np.ones(len(df), dtype=bool)
+    kept_rows = len(df)
+
+    # pd.to_numeric runs at most once per column, however many rules compare it
+    numeric_columns = {}
 
     # Apply filters from config file
     for rule in filter_rules:
         col, op, val = rule.get(COLUMN), rule.get(OPERATOR), rule.get(VALUE)
-        if col not in df_processed.columns:
+        if col not in df.columns:
             logging.warning(f"Filter rule column '{col}' not found. Skipping filter.")
             continue
         
-        initial_rows = len(df_processed)
-        ids_to_drop_this_step = set()
-        
         if op == "notna":
-            keep_mask = df_processed[col].notna()
+            keep_mask = df[col].notna().to_numpy()
         elif op == ">=":
-            numeric_col = pd.to_numeric(df_processed[col], errors='coerce')
-            keep_mask = numeric_col >= val
+            if col not in numeric_columns:
+                numeric_columns[col] = pd.to_numeric(df[col], errors='coerce')
+            # (values that are not numbers are missing, and never kept)
+            keep_mask = (numeric_columns[col] >= val).to_numpy(dtype=bool, na_value=False)
         else: # Add other operators as needed
             logging.warning(f"Filter operator '{op}' not implemented. Skipping.")
             continue
             
-        dropped_mask = ~keep_mask
-        ids_to_drop_this_step = set(df_processed.loc[dropped_mask, SOURCE_ID_COL].dropna())
-        filtered_ids.update(ids_to_drop_this_step)
-        df_processed = df_processed[keep_mask]
-        logging.info(f"  Filter '{col} {op} {val}': Removed {initial_rows - len(df_processed)} rows.")
+        keep &= keep_mask
+        initial_rows, kept_rows = kept_rows, int(keep.sum())
+        logging.info(f"  Filter '{col} {op} {val}': Removed {initial_rows - kept_rows} rows.")
         
-    # Special character filter on the ID column
-    initial_rows = len(df_processed)
-    special_char_mask = df_processed[SOURCE_ID_COL].astype(str).str.contains(SPECIAL_CHARS_PATTERN, regex=True, na=True)
-    ids_to_drop_special_chars = set(df_processed.loc[special_char_mask, SOURCE_ID_COL].dropna())
-    filtered_ids.update(ids_to_drop_special_chars)
-    df_processed = df_processed[~special_char_mask]
-    logging.info(f"  Filter 'Special Chars in ID': Removed {initial_rows - len(df_processed)} rows.")
+    # Special character filter on the ID column (a missing ID has none)
+    special_char_mask = df[SOURCE_ID_COL].str.contains(SPECIAL_CHARS_PATTERN, regex=True, na=False).to_numpy(dtype=bool)
+    keep &= ~special_char_mask
+    initial_rows, kept_rows = kept_rows, int(keep.sum())
+    logging.info(f"  Filter 'Special Chars in ID': Removed {initial_rows - kept_rows} rows.")
+
+    # IDs of the rows dropped by any of the filters, then the single slice of the surviving rows.
+    # The set is built from the underlying array: iterating it is about twice as fast as iterating the Series
+    filtered_ids = set(df.loc[~keep, SOURCE_ID_COL].dropna().to_numpy())
+    df_processed = df.loc[keep]
 
     # --- 2. Handle Pango Lineage based on config ---
     logging.info("Step 2: Processing lineage column...")
@@ -202,7 +242,7 @@ def process_ncbi_metadata(df: pd.DataFrame, filter_rules: list, source_lineage_c
             is_unclassifiable_mask = df_processed[source_lineage_col].str.lower().isin(['unclassified', 'unknown', 'na', 'n/a', 'not applicable'])
             combined_drop_mask = is_na_mask | is_unclassifiable_mask
 
-            ids_to_drop_no_lineage = set(df_processed.loc[combined_drop_mask, SOURCE_ID_COL].dropna())
+            ids_to_drop_no_lineage = set(df_processed.loc[combined_drop_mask, SOURCE_ID_COL].dropna().to_numpy())
             non_classified_ids.update(ids_to_drop_no_lineage)
             df_processed = df_processed[~combined_drop_mask]
             logging.info(f"  Identified and removed {len(ids_to_drop_no_lineage)} non-classified rows (missing '{source_lineage_col}').")
@@ -232,7 +272,8 @@ def process_ncbi_metadata(df: pd.DataFrame, filter_rules: list, source_lineage_c
     
     logging.info(f"Preprocessing complete. Final dataset has {len(df_final)} rows.")
     
-    return df_final, sorted(list(filtered_ids)), sorted(list(non_classified_ids))
+    # Returned as sets: they are sorted only when written out
+    return df_final, filtered_ids, non_classified_ids
 
 
 def main():
@@ -242,11 +283,15 @@ def main():
     parser.add_argument("--config", default="config/config.yaml", help="Path to the main YAML configuration file.")
     args = parser.parse_args()
 
-    config = yaml.safe_load(Path(args.config).read_text())
+    config = load_config(args.config)
     
     log_dir = Path(config.get(PATHS, {}).get(LOGS, 'logs'))
     setup_logging(log_dir=log_dir, log_name_prefix=f"{args.virus}_02.1_prep_metadata_ncbi")
 
+    # Copy-on-write: frames derived from another one share its data until either is modified,
+    # so the filtering steps need no defensive copies
+    pd.set_option('mode.copy_on_write', True)
+
     virus_config = config.get(VIRUSES, {}).get(args.virus, {})
     paths_config = config.get(PATHS, {})
     
@@ -259,28 +304,35 @@ def main():
     filtered_ids_file = processed_dir / "filtered_sequence_ids.txt"
     non_classified_ids_file = processed_dir / "non_classified_sequence_ids.txt"
 
+    filter_rules = virus_config.get(PARAMETERS, {}).get(METADATA_PROCESSING, {}).get(FILTERS, [])
+    source_lineage_col = virus_config.get(PARAMETERS, {}).get(METADATA_PROCESSING, {}).get(SOURCE_LINEAGE_COLUMN, "NONE")
+
+    # Only the columns used by the processing are parsed (as strings, see read_metadata_columns)
+    used_columns = set(COLUMN_MAPPING) | set(LOCATION_SOURCE_COLUMNS) | {rule.get(COLUMN) for rule in filter_rules} | {source_lineage_col}
+
     logging.info(f"Loading raw metadata from {input_file}...")
     try:
-        df_raw = pd.read_csv(input_file, sep='\t', low_memory=False)
+        df_raw = read_metadata_columns(input_file, used_columns, delimiter='\t')
     except FileNotFoundError:
         logging.error(f"Raw metadata file not found. Please run the '01_fetch_data' script first.")
         sys.exit(1)
-
-    filter_rules = virus_config.get(PARAMETERS, {}).get(METADATA_PROCESSING, {}).get(FILTERS, [])
-    source_lineage_col = virus_config.get(PARAMETERS, {}).get(METADATA_PROCESSING, {}).get(SOURCE_LINEAGE_COLUMN, "NONE")
     
     df_processed, filtered_ids, non_classified_ids = process_ncbi_metadata(df_raw, filter_rules, source_lineage_col)
+    # The raw table is not needed anymore: release it before writing the outputs
+    del df_raw
     
     logging.info(f"Saving processed metadata ({len(df_processed)} rows) to {output_file}...")
     df_processed.to_csv(output_file, sep='\t', index=False, na_rep='NA')
 
     logging.info(f"Saving {len(filtered_ids)} quality-filtered sequence IDs to {filtered_ids_file}...")
     with open(filtered_ids_file, 'w') as f:
-        f.write('\n'.join(filtered_ids))
+        # one line per ID, written as it goes (no joined copy of the whole list)
+        f.writelines(f"{sequence_id}\n" for sequence_id in sorted(filtered_ids))
         
     logging.info(f"Saving {len(non_classified_ids)} non-classified sequence IDs to {non_classified_ids_file}...")
     with open(non_classified_ids_file, 'w') as f:
-        f.write('\n'.join(non_classified_ids))
+        # one line per ID, written as it goes (no joined copy of the whole list)
+        f.writelines(f"{sequence_id}\n" for sequence_id in sorted(non_classified_ids))
 
     logging.info("Script finished successfully.")
 
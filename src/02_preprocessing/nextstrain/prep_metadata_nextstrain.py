@@ -2,11 +2,12 @@
 
 import argparse
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 from pathlib import Path
 import sys
 import logging
 import re
-import yaml
 from typing import Tuple, List, Set
 
 # Add the project's 'src' directory to the Python path.
@@ -14,7 +15,7 @@ SRC_PATH = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config, read_metadata_columns
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -22,7 +23,18 @@ except ImportError as e:
 
 # --- Constants ---
 # The primary ID column in the raw Nextstrain metadata that maps to our standard "Virus name"
-SPECIAL_CHARS_PATTERN = re.compile(r'[&/\\:]')
+# The metadata columns are Arrow-backed strings (see read_metadata_columns): the patterns below are
+# pattern strings, matched by the Arrow regex kernels (which need named groups for extract)
+STRING_DTYPE = pd.ArrowDtype(pa.string())
+SPECIAL_CHARS_PATTERN = r'[&/\\:]'
+# YYYY, YYYY-MM or YYYY-MM-DD, with year, month and day captured
+DATE_PATTERN = r'^(?P<year>\d{4})(?:-(?P<month>\d{2}))?(?:-(?P<day>\d{2}))?$'
+
+# Patterns and null-like strings used for the date format statistics
+YMD_PATTERN = r'\d{4}-\d{2}-\d{2}'
+YM_PATTERN = r'\d{4}-\d{2}'
+Y_PATTERN = r'\d{4}'
+NULL_LIKE_VALUES = frozenset({'nan', 'na', 'nat', '<na>', ''})
 
 # Hardcoded column mapping for Nextstrain data
 # Defines the final output columns and their source.
@@ -33,82 +45,92 @@ COLUMN_MAPPING = {
     "date_submitted": "Submission date"
 }
 
+# The raw columns combined into 'Location': region and country
+LOCATION_SOURCE_COLUMNS = ('region', 'country')
+# Mutation columns kept as they are for SARS-CoV-2
+COVID_MUTATION_COLUMNS = ("substitutions", "deletions", "insertions")
+
 # --- Formatting Functions ---
 
-def _format_single_date(date_str: str) -> str:
+def _parse_other_date(date_str: str) -> str:
+    """
+    Fallback for the dates that are not in YYYY, YYYY-MM or YYYY-MM-DD format:
+    tries pandas to_datetime and returns pd.NA if it fails.
+    """
+    try:
+        return pd.to_datetime(date_str).strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return pd.NA
+
+def _format_unique_dates(unique_dates: pd.Index) -> pd.api.extensions.ExtensionArray:
     """
-    Helper function to format a single date string according to specific rules.
+    Formats the distinct date strings according to specific rules, with vectorized string operations.
     - YYYY-MM-DD -> YYYY-MM-DD
     - YYYY-MM    -> YYYY-MM-01
     - YYYY       -> YYYY-01-01
     - 'XX' in YYYY-XX-XX or YYYY-MM-XX -> replaced with '01'
-    Returns pd.NA for invalid or unparseable formats.
+    Any time part is removed first; other formats go through _parse_other_date.
+    Returns an Arrow string array aligned with unique_dates, with missing values for invalid or unparseable dates
+    (take it with allow_fill=True, so that the code -1 that pd.factorize gives to missing values stays missing).
     """
-    if pd.isna(date_str):
-        return pd.NA
-    
-    date_str = str(date_str).strip()
-    date_str = date_str.split('T')[0] # Remove time part if present
+    dates = pd.Series(unique_dates, dtype=STRING_DTYPE).str.strip().str.split('T', n=1).list[0]
+    dates = dates.str.upper().str.replace('XX', '01', regex=False)
 
-    date_str = date_str.upper().replace('XX', '01')
-    
-    # Check for YYYY-MM-DD format
-    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', date_str):
-        return date_str
-    # Check for YYYY-MM format
-    elif re.fullmatch(r'\d{4}-\d{2}', date_str):
-        return f"{date_str}-01"
-    # Check for YYYY format
-    elif re.fullmatch(r'\d{4}', date_str):
-        return f"{date_str}-01-01"
-    else:
-        # As a fallback, try pandas to_datetime for other potential formats
-        # If it fails, return NA
-        try:
-            return pd.to_datetime(date_str).strftime('%Y-%m-%d')
-        except (ValueError, TypeError):
-            return pd.NA
+    parts = dates.str.extract(DATE_PATTERN)
+    # (an optional group that did not match is extracted as '', a date that did not match as missing)
+    formatted = parts['year'] + '-' + parts['month'].replace('', '01') + '-' + parts['day'].replace('', '01')
+
+    # Only the (few) distinct dates in other formats are parsed one by one
+    other_mask = parts['year'].isna() & dates.notna()
+    if other_mask.any():
+        formatted[other_mask] = dates[other_mask].map(_parse_other_date)
+
+    return formatted.array
 
 def format_date_columns(df: pd.DataFrame) -> Tuple[pd.DataFrame, Set[str]]:
     """
     Applies standardized date formatting to the relevant columns and logs format statistics.
+    Dates repeat a lot across rows: each column is factorized, each distinct value is checked, analyzed
+    and formatted once, and the results are spread back to the rows.
     """
     logging.info("Formatting date columns...")
     
     date_cols_to_process = ['Collection date', 'Submission date']
     dropped_ids = set()
-    df_formatted = df.copy()
+    df_formatted = df.copy(deep=False)
     
     for col_name in date_cols_to_process:
         if col_name in df_formatted.columns:
             logging.info(f"  - Analyzing and formatting '{col_name}'")
+            codes, unique_dates = pd.factorize(df_formatted[col_name])
+            # The distinct values are strings already (and never missing): they are matched as they are
+            unique_str = pd.Series(unique_dates, dtype=STRING_DTYPE)
 
             # First, identify and drop rows where the date starts with 'XXXX'
-            # Ensure the column is treated as string for this check
-            is_xxxx_mask = df_formatted[col_name].astype(str).str.startswith('XXXX', na=False)
-            if is_xxxx_mask.any():
-                xxxx_dropped_ids = set(df_formatted.loc[is_xxxx_mask, 'Virus name'].dropna())
+            is_xxxx = unique_str.str.startswith('XXXX', na=False).to_numpy()
+            if is_xxxx.any():
+                # Missing values have code -1, which picks the trailing False
+                is_xxxx_mask = np.append(is_xxxx, False)[codes]
+                xxxx_dropped_ids = set(df_formatted.loc[is_xxxx_mask, 'Virus name'].dropna().to_numpy())
                 dropped_ids.update(xxxx_dropped_ids)
-                df_formatted = df_formatted[~is_xxxx_mask].copy()
+                df_formatted = df_formatted[~is_xxxx_mask]
+                codes = codes[~is_xxxx_mask]
                 logging.info(f"    Removed {len(xxxx_dropped_ids)} rows with incomplete 'XXXX' dates.")
             
             # --- New Logging Logic ---
-            # Work with a string representation of the series for pattern matching
-            series_str = df_formatted[col_name].astype(str)
-            
-            # Count initial NAs by checking for pandas NA and common null-like strings
-            na_mask = df_formatted[col_name].isna() | series_str.str.lower().isin(['nan', 'na', 'nat', '<na>', ''])
-            na_count = na_mask.sum()
-            
-            # Analyze only the non-NA part of the series
-            non_na_series = series_str[~na_mask]
+            # Number of rows holding each distinct value
+            counts = np.bincount(codes[codes >= 0], minlength=len(unique_dates))
+
+            # Count initial NAs: missing values (code -1) and common null-like strings
+            is_na = unique_str.str.lower().isin(NULL_LIKE_VALUES).to_numpy()
+            na_count = int((codes < 0).sum() + counts[is_na].sum())
             
-            ymd_count = non_na_series.str.fullmatch(r'\d{4}-\d{2}-\d{2}', na=False).sum()
-            ym_count = non_na_series.str.fullmatch(r'\d{4}-\d{2}', na=False).sum()
-            y_count = non_na_series.str.fullmatch(r'\d{4}', na=False).sum()
+            ymd_count = int(counts[unique_str.str.fullmatch(YMD_PATTERN, na=False).to_numpy() & ~is_na].sum())
+            ym_count = int(counts[unique_str.str.fullmatch(YM_PATTERN, na=False).to_numpy() & ~is_na].sum())
+            y_count = int(counts[unique_str.str.fullmatch(Y_PATTERN, na=False).to_numpy() & ~is_na].sum())
             
             # Count how many will fall into the 'else' block (unparseable or other formats)
-            else_count = len(non_na_series) - (ymd_count + ym_count + y_count)
+            else_count = len(codes) - na_count - (ymd_count + ym_count + y_count)
 
             logging.info(f"    Date format statistics for '{col_name}':")
             logging.info(f"      YYYY-MM-DD format: {ymd_count}")
@@ -118,11 +140,23 @@ def format_date_columns(df: pd.DataFrame) -> Tuple[pd.DataFrame, Set[str]]:
             logging.info(f"      Missing (NA)     : {na_count}")
             # --- End of New Logging Logic ---
 
-            # Apply the transformation to each cell in the column
-            df_formatted[col_name] = df_formatted[col_name].apply(_format_single_date)
+            # Transform the whole column at once
+            df_formatted[col_name] = pd.Series(_format_unique_dates(unique_dates).take(codes, allow_fill=True), index=df_formatted.index)
             
     return df_formatted, dropped_ids
 
+def _factorize_as_str(df: pd.DataFrame, col: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Factorizes a column into (codes, distinct values as strings), with codes indexing the values.
+    Missing values become 'nan' (the distinct values are strings already); a missing column is all empty strings.
+    """
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.intp), np.array([''], dtype=object)
+    codes, uniques = pd.factorize(df[col])
+    values = np.append(np.asarray(uniques, dtype=object), 'nan')
+    # Missing values have code -1: point them to the trailing 'nan'
+    return np.where(codes < 0, len(values) - 1, codes), values
+
 def format_location_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     Combines 'region' and 'country' into a single 'Location' column.
@@ -130,29 +164,26 @@ def format_location_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     logging.info("Formatting 'Location' column by combining 'region' and 'country'...")
     
-    region_col = 'region'
-    country_col = 'country'
+    region_col, country_col = LOCATION_SOURCE_COLUMNS
 
-    # Handle potentially missing columns by creating empty Series if needed
-    region_series = df[region_col].astype(str).fillna('') if region_col in df.columns else pd.Series([''] * len(df), index=df.index)
-    country_series = df[country_col].astype(str).fillna('') if country_col in df.columns else pd.Series([''] * len(df), index=df.index)
-    country_series = country_series.str.split(':', n=1).str[0].str.strip()
+    # Only a few hundred (region, country) pairs occur: each distinct pair is combined once
+    # and the results are spread back to the rows
+    region_codes, region_values = _factorize_as_str(df, region_col)
+    country_codes, country_values = _factorize_as_str(df, country_col)
+    pair_codes, unique_pairs = pd.factorize(region_codes * len(country_values) + country_codes)
 
-    # Combine using apply
-    def combine_location(row):
-        region = row['region']
-        country = row['country']
-        if region and country:
-            return f"{region} / {country}"
-        elif region:
-            return region
-        elif country:
-            return country
-        else:
-            return pd.NA # Use pandas NA for missing location
+    region_series = pd.Series(region_values[unique_pairs // len(country_values)], dtype=object)
+    country_series = pd.Series(country_values[unique_pairs % len(country_values)], dtype=object)
+    country_series = country_series.str.split(':', n=1).str[0].str.strip()
 
-    # Create the new 'Location' series using your logic
-    location_series = pd.DataFrame({'region': region_series, 'country': country_series}).apply(combine_location, axis=1)
+    # Combine column-wise: 'region / country' if both are present, else whichever is present, else NA
+    has_region = region_series != ''
+    has_country = country_series != ''
+    unique_locations = (region_series + ' / ' + country_series).where(
+        has_region & has_country,
+        region_series.where(has_region, country_series.where(has_country, pd.NA))
+    )
+    location_series = pd.Series(pd.array(unique_locations, dtype=STRING_DTYPE).take(pair_codes), index=df.index)
     
     # Assign the new series to the 'Location' column of the DataFrame
     df['Location'] = location_series
@@ -165,7 +196,8 @@ def format_location_column(df: pd.DataFrame) -> pd.DataFrame:
 
 def process_nextstrain_metadata(df: pd.DataFrame, filter_rules: list, source_lineage_col: str, column_mapping: dict, isCovid: bool) -> Tuple[pd.DataFrame, Set[str], Set[str]]:
     """Applies a full preprocessing workflow to the raw Nextstrain metadata."""
-    df_processed = df.copy()
+    # Shallow: the rows are only ever filtered and columns replaced, never modified in place
+    df_processed = df.copy(deep=False)
 
     logging.info(f"Starting preprocessing of Nextstrain metadata with {len(df_processed)} rows.")
     
@@ -175,42 +207,56 @@ def process_nextstrain_metadata(df: pd.DataFrame, filter_rules: list, source_lin
         logging.error(f"Source ID column '{source_id_col}' not found in the data. Exiting.")
         sys.exit(1)
 
-    filtered_ids = set()
     non_classified_ids = set()
 
     # --- 1. Apply Quality Filters from Config ---
+    # Every filter is evaluated against the starting frame and accumulated into a single keep mask:
+    # the dropped IDs are collected and the rows are sliced only once, after the last filter
     logging.info("Step 1: Applying quality filters from config...")
+    keep = np.ones(len(df_processed), dtype=bool)
+    kept_rows = len(df_processed)
+
+    # pd.to_numeric runs at most once per column, however many rules compare it
+    numeric_columns = {}
+    def numeric(col: str) -> pd.Series:
+        if col not in numeric_columns:
+            numeric_columns[col] = pd.to_numeric(df_processed[col], errors='coerce')
+        return numeric_columns[col]
+    def is_number(val) -> bool:
+        return isinstance(val, (int, float)) and not isinstance(val, bool)
+
     for rule in filter_rules:
         col, op, val = rule.get('column'), rule.get('operator'), rule.get('value')
         if col not in df_processed.columns:
             logging.warning(f"Filter rule column '{col}' not found. Skipping filter.")
             continue
         
-        initial_rows = len(df_processed)
         if op == "notna": keep_mask = df_processed[col].notna()
-        elif op == ">=": numeric_col = pd.to_numeric(df_processed[col], errors='coerce'); keep_mask = numeric_col >= val
-        elif op == ">": numeric_col = pd.to_numeric(df_processed[col], errors='coerce'); keep_mask = numeric_col > val
-        elif op == "<=": numeric_col = pd.to_numeric(df_processed[col], errors='coerce'); keep_mask = numeric_col <= val
-        elif op == "<": numeric_col = pd.to_numeric(df_processed[col], errors='coerce'); keep_mask = numeric_col < val
-        elif op == "==": keep_mask = df_processed[col] == val
-        elif op == "!=": keep_mask = df_processed[col] != val
+        elif op == ">=": keep_mask = numeric(col) >= val
+        elif op == ">": keep_mask = numeric(col) > val
+        elif op == "<=": keep_mask = numeric(col) <= val
+        elif op == "<": keep_mask = numeric(col) < val
+        # (the columns are read as strings: numbers are compared as numbers)
+        elif op == "==": keep_mask = numeric(col) == val if is_number(val) else df_processed[col] == val
+        elif op == "!=": keep_mask = numeric(col) != val if is_number(val) else df_processed[col] != val
         else: logging.warning(f"Filter operator '{op}' not implemented. Skipping."); continue
             
-        dropped_mask = ~keep_mask
-        ids_to_drop_this_step = set(df_processed.loc[dropped_mask, source_id_col].dropna())
-        filtered_ids.update(ids_to_drop_this_step)
-        df_processed = df_processed[keep_mask]
-        logging.info(f"  Filter '{col} {op} {val}': Removed {initial_rows - len(df_processed)} rows.")
+        # (values that are missing, or not numbers, only pass '!=')
+        keep &= keep_mask.to_numpy(dtype=bool, na_value=(op == "!="))
+        initial_rows, kept_rows = kept_rows, int(keep.sum())
+        logging.info(f"  Filter '{col} {op} {val}': Removed {initial_rows - kept_rows} rows.")
         
     if not isCovid:
         # --- 2. Special Character Filter on ID ---
         logging.info("Step 2: Checking for special characters in ID...")
-        initial_rows = len(df_processed)
-        special_char_mask = df_processed[source_id_col].astype(str).str.contains(SPECIAL_CHARS_PATTERN, regex=True, na=True)
-        ids_to_drop_special_chars = set(df_processed.loc[special_char_mask, source_id_col].dropna())
-        filtered_ids.update(ids_to_drop_special_chars)
-        df_processed = df_processed[~special_char_mask]
-        logging.info(f"  Filter 'Special Chars in ID': Removed {initial_rows - len(df_processed)} rows.")
+        # (a missing ID has none)
+        special_char_mask = df_processed[source_id_col].str.contains(SPECIAL_CHARS_PATTERN, regex=True, na=False)
+        keep &= ~special_char_mask.to_numpy(dtype=bool)
+        initial_rows, kept_rows = kept_rows, int(keep.sum())
+        logging.info(f"  Filter 'Special Chars in ID': Removed {initial_rows - kept_rows} rows.")
+
+    filtered_ids = set(df_processed.loc[~keep, source_id_col].dropna().to_numpy())
+    df_processed = df_processed[keep]
     
     # --- 3. Handle Pango Lineage ---
     logging.info("Step 3: Processing lineage column...")
@@ -218,7 +264,7 @@ def process_nextstrain_metadata(df: pd.DataFrame, filter_rules: list, source_lin
         logging.info(f"Using source column '{source_lineage_col}' for lineage information.")
         if source_lineage_col in df_processed.columns:
             lineage_na_mask = df_processed[source_lineage_col].isna()
-            ids_to_drop_no_lineage = set(df_processed.loc[lineage_na_mask, source_id_col].dropna())
+            ids_to_drop_no_lineage = set(df_processed.loc[lineage_na_mask, source_id_col].dropna().to_numpy())
             non_classified_ids.update(ids_to_drop_no_lineage)
             df_processed = df_processed[~lineage_na_mask]
             column_mapping[source_lineage_col] = 'Pango lineage'
@@ -244,7 +290,7 @@ def process_nextstrain_metadata(df: pd.DataFrame, filter_rules: list, source_lin
     df_processed = format_location_column(df_processed)
     
     # Select and order final columns
-    if isCovid: expected_final_columns = ["Virus name", "Collection date", "Submission date", "Location", "Pango lineage", "substitutions", "deletions", "insertions"]
+    if isCovid: expected_final_columns = ["Virus name", "Collection date", "Submission date", "Location", "Pango lineage", *COVID_MUTATION_COLUMNS]
     else:       expected_final_columns = ["Virus name", "Collection date", "Submission date", "Location", "Pango lineage"]
     
     final_columns_to_keep = [col for col in expected_final_columns if col in df_processed.columns]
@@ -252,7 +298,8 @@ def process_nextstrain_metadata(df: pd.DataFrame, filter_rules: list, source_lin
     
     logging.info(f"Preprocessing complete. Final dataset has {len(df_final)} rows.")
     
-    return df_final, sorted(list(filtered_ids)), sorted(list(non_classified_ids))
+    # Returned as sets: they are sorted only when written out
+    return df_final, filtered_ids, non_classified_ids
 
 
 def main():
@@ -262,11 +309,15 @@ def main():
     parser.add_argument("--config", default="config/config.yaml", help="Path to the main YAML configuration file.")
     args = parser.parse_args()
 
-    config = yaml.safe_load(Path(args.config).read_text())
+    config = load_config(args.config)
     
     log_dir = Path(config.get(PATHS, {}).get(LOGS, 'logs'))
     setup_logging(log_dir=log_dir, log_name_prefix=f"{args.virus}_02.1_prep_metadata_nextstrain")
 
+    # Copy-on-write: frames derived from another one share its data until either is modified,
+    # so the filtering steps need no defensive copies
+    pd.set_option('mode.copy_on_write', True)
+
     virus_config = config.get(VIRUSES, {}).get(args.virus, {})
     paths_config = config.get(PATHS, {})
     
@@ -279,13 +330,6 @@ def main():
     filtered_ids_file = processed_dir / "filtered_sequence_ids.txt"
     non_classified_ids_file = processed_dir / "non_classified_sequence_ids.txt"
 
-    logging.info(f"Loading raw metadata from {input_file}...")
-    try:
-        df_raw = pd.read_csv(input_file, sep='\t', low_memory=False)
-    except FileNotFoundError:
-        logging.error(f"Raw metadata file not found. Please run '01_fetch_data' first.")
-        sys.exit(1)
-
     processing_params = virus_config.get(PARAMETERS, {}).get(METADATA_PROCESSING, {})
     filter_rules = processing_params.get(FILTERS, [])
     source_lineage_col = processing_params.get(SOURCE_LINEAGE_COLUMN, 'NONE')
@@ -296,19 +340,39 @@ def main():
         COLUMN_MAPPING['strain'] = COLUMN_MAPPING.pop('accession', 'Virus name')
         isCovid = True
     
+    # Only the columns used by the processing are parsed (as strings, see read_metadata_columns)
+    used_columns = set(COLUMN_MAPPING) | set(LOCATION_SOURCE_COLUMNS) | {rule.get(COLUMN) for rule in filter_rules} | {source_lineage_col}
+    if isCovid:
+        used_columns |= set(COVID_MUTATION_COLUMNS)
+
+    # Region and country take a few hundred distinct values over millions of rows: read them dictionary-encoded,
+    # as categoricals (one small code per row instead of a string), unless a filter rule needs their raw values
+    categorical_columns = set(LOCATION_SOURCE_COLUMNS) - {rule.get(COLUMN) for rule in filter_rules}
+
+    logging.info(f"Loading raw metadata from {input_file}...")
+    try:
+        df_raw = read_metadata_columns(input_file, used_columns, delimiter='\t', categorical_columns=categorical_columns)
+    except FileNotFoundError:
+        logging.error(f"Raw metadata file not found. Please run '01_fetch_data' first.")
+        sys.exit(1)
+
     # Pass a copy of the mapping constant to the processing function
     df_processed, filtered_ids, non_classified_ids = process_nextstrain_metadata(df_raw, filter_rules, source_lineage_col, COLUMN_MAPPING.copy(), isCovid=isCovid)
+    # The raw table is not needed anymore: release it before writing the outputs
+    del df_raw
     
     logging.info(f"Saving processed metadata ({len(df_processed)} rows) to {output_file}...")
     df_processed.to_csv(output_file, sep='\t', index=False, na_rep='NA')
 
     logging.info(f"Saving {len(filtered_ids)} quality-filtered sequence IDs to {filtered_ids_file}...")
     with open(filtered_ids_file, 'w') as f:
-        f.write('\n'.join(filtered_ids))
+        # one line per ID, written as it goes (no joined copy of the whole list)
+        f.writelines(f"{sequence_id}\n" for sequence_id in sorted(filtered_ids))
         
     logging.info(f"Saving {len(non_classified_ids)} non-classified sequence IDs to {non_classified_ids_file}...")
     with open(non_classified_ids_file, 'w') as f:
-        f.write('\n'.join(non_classified_ids))
+        # one line per ID, written as it goes (no joined copy of the whole list)
+        f.writelines(f"{sequence_id}\n" for sequence_id in sorted(non_classified_ids))
 
     logging.info("Script finished successfully.")
 
@@ -1,7 +1,6 @@
 # src/03_haplocov/run_haplocov.py
 
 import argparse
-import yaml
 from pathlib import Path
 import sys
 import logging
@@ -13,7 +12,7 @@ SRC_PATH = Path(__file__).resolve().parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging, run_command
+    from utils.utils import setup_logging, run_command, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -135,7 +134,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        config = yaml.safe_load(Path(args.config).read_text())
+        config = load_config(args.config)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
@@ -5,7 +5,6 @@ import pandas as pd
 from pathlib import Path
 import sys
 import logging
-import yaml
 import re
 
 # Add the project's 'src' directory to the Python path.
@@ -13,7 +12,7 @@ SRC_PATH = Path(__file__).resolve().parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -133,7 +132,7 @@ def main():
         print(f"Error: This script is specifically designed for 'sars-cov-2'. You provided '{args.virus}'.")
         sys.exit(1)
 
-    config = yaml.safe_load(Path(args.config).read_text())
+    config = load_config(args.config)
     
     log_dir = Path(config.get(PATHS, {}).get(LOGS, 'logs'))
     setup_logging(log_dir=log_dir, log_name_prefix=f"{args.virus}_04_format_covid_variations")
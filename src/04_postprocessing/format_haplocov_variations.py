@@ -5,7 +5,6 @@ import pandas as pd
 from pathlib import Path
 import sys
 import logging
-import yaml
 from tqdm import tqdm
 from typing import List
 
@@ -14,7 +13,7 @@ SRC_PATH = Path(__file__).resolve().parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -196,7 +195,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        config = yaml.safe_load(Path(args.config).read_text())
+        config = load_config(args.config)
     except FileNotFoundError:
         print(f"CRITICAL ERROR: Config file not found at '{args.config}'", file=sys.stderr)
         sys.exit(1)
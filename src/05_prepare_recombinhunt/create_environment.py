@@ -5,7 +5,6 @@ import pandas as pd
 from pathlib import Path
 import sys
 import logging
-import yaml
 from collections import Counter
 from typing import Dict, Tuple
 
@@ -14,7 +13,7 @@ SRC_PATH = Path(__file__).resolve().parent.parent
 sys.path.append(str(SRC_PATH))
 
 try:
-    from utils.utils import setup_logging
+    from utils.utils import setup_logging, load_config
     from utils.constants import *
 except ImportError as e:
     print(f"Error: Could not import a required module. {e}")
@@ -258,7 +257,7 @@ def main():
     parser.add_argument("--config", default="config/config.yaml", help="Path to the main YAML configuration file.")
     args = parser.parse_args()
 
-    config = yaml.safe_load(Path(args.config).read_text())
+    config = load_config(args.config)
     
     log_dir = Path(config.get(PATHS, {}).get(LOGS))
     setup_logging(log_dir=log_dir, log_name_prefix=f"{args.virus}_05.1_create_environment")
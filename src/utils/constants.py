@@ -38,6 +38,8 @@ TAXON_ID = "taxon_id"
 REFERENCE = "reference"
 LENGTH = "length"
 PARAMETERS = "parameters"
+# Written by the download step, not by the user
+DOWNLOAD_DATE = "download_date"
 
 # --- Keys within the 'reference' block ---
 ACCESSION_ID = "accession_id"
@@ -77,6 +79,13 @@ ALL = "all"
 SEQUENCES = "sequences"
 # The 'REFERENCE' key is already defined above and can be reused here.
 
+# --- Keys for the efetch download block (under 'ftp-cli') ---
+EFETCH = "efetch"
+ENABLED = "enabled"
+BATCH_SIZE = "batch_size"
+WORKERS = "workers"
+API_KEY = "api_key"
+
 # --- Keys for Nextstrain URL parameters ---
 METADATA = "metadata"
 SEQUENCES = "sequences"
@@ -1,12 +1,28 @@
 # src/utils/utils.py
 
 import subprocess
+import os
 import shutil
+import zipfile
+import fnmatch
 from pathlib import Path
 import logging
 import sys
+import pickle
+import yaml
+try:
+    # libyaml-backed loader/dumper, several times faster than the pure-Python ones
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 from datetime import datetime
 
+# Buffer size used to copy large (FASTA/metadata) files: far fewer read/write calls than the 64 KiB default
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Directory, inside the raw data directory, where fetch_reference_fasta keeps the downloaded reference archives
+REFERENCE_CACHE_DIR = "reference_cache"
+
 def setup_logging(log_dir: Path, log_name_prefix: str):
     """
     Sets up logging to write to both a file and the console.
@@ -46,6 +62,106 @@ def setup_logging(log_dir: Path, log_name_prefix: str):
     logging.info(f"Logging initialized. Log file at: {log_filepath}")
     return log_filepath
 
+# Configurations already loaded by this process: path -> (mtime, size, config)
+_loaded_configs = {}
+
+def config_cache_path(config_path: Path) -> Path:
+    """Path of the parsed copy of a YAML configuration file kept by load_config."""
+    config_path = Path(config_path)
+    return config_path.with_name(f"{config_path.name}.cache.pkl")
+
+def load_config(config_path: Path) -> dict:
+    """
+    Loads the YAML configuration file.
+    The parsed configuration is also pickled next to it (see config_cache_path), and that copy is
+    loaded instead of parsing the YAML again as long as the YAML file has not been modified
+    (same modification time and size). Within a process, a configuration is loaded only once.
+
+    Raises FileNotFoundError or yaml.YAMLError.
+    """
+    config_path = Path(config_path)
+    cache_path = config_cache_path(config_path)
+    stat = config_path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    loaded = _loaded_configs.get(config_path.resolve())
+    if loaded is not None and loaded[0] == signature:
+        return loaded[1]
+
+    config = None
+    try:
+        with open(cache_path, "rb") as f:
+            cached_signature, cached_config = pickle.load(f)
+        if cached_signature == signature:
+            config = cached_config
+    except Exception:
+        # missing, stale or corrupt cache: fall back to the YAML file
+        pass
+
+    if config is None:
+        config = yaml.load(config_path.read_text(), Loader=SafeLoader)
+
+        # written to a temporary file and renamed, so concurrent readers never see a partial cache
+        temp_cache_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(temp_cache_path, "wb") as f:
+                pickle.dump((signature, config), f)
+            os.replace(temp_cache_path, cache_path)
+        except OSError as e:
+            logging.debug(f"Could not write the config cache {cache_path}: {e}")
+
+    _loaded_configs[config_path.resolve()] = (signature, config)
+    return config
+
+# Strings read as missing values by read_metadata_columns: the default NA strings of pandas.read_csv
+METADATA_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# Bytes of the raw metadata parsed per block (and per thread) by read_metadata_columns
+METADATA_BLOCK_SIZE = 16 << 20
+
+def read_metadata_columns(input_file: Path, columns: set, delimiter: str = ",", categorical_columns=()):
+    """
+    Reads the given columns of a raw metadata table with the (multithreaded) pyarrow CSV reader:
+    the other columns are skipped while parsing, and columns missing from the file are left out.
+    Every column is read as strings, exactly as written (columns compared as numbers go through pd.to_numeric),
+    and kept as Arrow-backed strings (pd.ArrowDtype(pa.string())), so that the string operations run on Arrow kernels;
+    categorical_columns are dictionary-encoded and become pandas categoricals.
+    Empty fields and the default NA strings of pandas.read_csv are missing values.
+
+    Raises FileNotFoundError if the file does not exist.
+    """
+    # imported here: most of the scripts using utils never read a metadata table
+    import csv
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    # the header alone tells which of the columns exist
+    with open(input_file, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f, delimiter=delimiter), [])
+    include_columns = [col for col in header if col in columns]
+
+    column_types = {
+        col: pa.dictionary(pa.int32(), pa.string()) if col in categorical_columns else pa.string()
+        for col in include_columns
+    }
+    table = pa_csv.read_csv(
+        input_file,
+        read_options=pa_csv.ReadOptions(block_size=METADATA_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=include_columns,
+            column_types=column_types,
+            null_values=METADATA_NULL_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    string_dtype = pd.ArrowDtype(pa.string())
+    return table.to_pandas(types_mapper=lambda arrow_type: string_dtype if arrow_type == pa.string() else None)
+
 def run_command(command: str, working_dir: Path):
     """Executes a shell command in a specified directory and checks for errors."""
     logging.info(f"Executing: {command}")
@@ -68,6 +184,96 @@ def run_command(command: str, working_dir: Path):
         logging.error(f"Stdout: {e.stdout}")
         raise # Re-raise the exception to be handled by the calling function
 
+def extract_zip_members(zip_path: Path, targets: dict) -> set:
+    """
+    Extracts only the zip members named in targets, which maps a member's file name (without its
+    directory, shell-style wildcards allowed, e.g. '*.fna') to the path it is written to. Each member is
+    streamed straight to its target with a COPY_BUFFER_SIZE buffer, and the rest of the archive is never
+    written to disk.
+    Returns the names/patterns that were found; one matching more than one member is extracted from the first one.
+    """
+    extracted = set()
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            name = info.filename.rsplit('/', 1)[-1]
+            pattern = next((pattern for pattern in targets if fnmatch.fnmatchcase(name, pattern)), None)
+            if pattern is None:
+                continue
+            if pattern in extracted:
+                logging.warning(f"Found multiple members matching '{pattern}' in {zip_path}. Keeping the first one.")
+                continue
+            target = Path(targets[pattern])
+            target.parent.mkdir(parents=True, exist_ok=True)
+            logging.info(f"Extracting {info.filename} to {target}")
+            # Written next to the target and renamed over it: an existing target gets a new file instead of
+            # being truncated in place, which would also rewrite any hard link to it (see link_or_copy)
+            partial_path = target.with_name(f"{target.name}.part")
+            try:
+                with zip_ref.open(info) as f_in, open(partial_path, 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out, length=COPY_BUFFER_SIZE)
+                os.replace(partial_path, target)
+            finally:
+                partial_path.unlink(missing_ok=True)
+            extracted.add(pattern)
+
+    for pattern in targets.keys() - extracted:
+        logging.warning(f"Could not find any member matching '{pattern}' in {zip_path}")
+    return extracted
+
+def fetch_reference_fasta(command_templates: list, accession_id: str, virus_name: str, cache_dir: Path, destination_path: Path):
+    """
+    Fetches the reference sequence of an NCBI accession and writes it to destination_path.
+    The zip archive downloaded by command_templates (NCBI datasets commands, formatted with accession_id and
+    virus_name and expected to create '{virus_name}-reference.zip') is kept in cache_dir as '{accession_id}.zip',
+    and later calls for the same accession reuse it instead of downloading it again.
+    Raises subprocess.CalledProcessError if a download command fails.
+    """
+    cache_dir = Path(cache_dir)
+    cached_zip = cache_dir / f"{accession_id}.zip"
+
+    if cached_zip.exists() and cached_zip.stat().st_size > 0:
+        logging.info(f"Using the cached reference archive {cached_zip}")
+    else:
+        # Downloaded in a directory of its own, then moved into the cache once complete
+        temp_dir = cache_dir / f"temp_{accession_id}_{os.getpid()}"
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            for command_template in command_templates:
+                command = command_template.format(accession_id=accession_id, virus_name=virus_name)
+                run_command(command, temp_dir)
+            os.replace(temp_dir / f"{virus_name}-reference.zip", cached_zip)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    logging.info(f"Unzipping {cached_zip}...")
+    extract_zip_members(cached_zip, {"genomic.fna": destination_path})
+
+def link_or_copy(source_path: Path, destination_path: Path):
+    """
+    Makes destination_path a hard link to source_path, or a copy of it when a hard link is not possible
+    (e.g. across devices). Only for files that are read, never modified in place, afterwards.
+    The link/copy is made next to the destination and renamed over it, so an existing file is replaced atomically.
+    Raises FileNotFoundError if source_path does not exist.
+    """
+    source_path, destination_path = Path(source_path), Path(destination_path)
+    if destination_path.exists() and os.path.samefile(source_path, destination_path):
+        return
+
+    temp_path = destination_path.with_name(f"{destination_path.name}.tmp")
+    temp_path.unlink(missing_ok=True)
+    try:
+        try:
+            os.link(source_path, temp_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, destination_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
 def find_and_rename(start_path: Path, pattern: str, new_name: str, destination_dir: Path):
     """
     Finds a single file matching a pattern, renames it, and moves it.